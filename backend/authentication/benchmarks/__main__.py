@@ -0,0 +1,91 @@
+"""Offline benchmark suite, run with `python -m benchmarks` after `uv sync --extra bench`.
+
+Results are printed and, with `--output`, saved as JSON tagged with the commit they were measured on. Passing an
+earlier file to `--compare` prints the change of every benchmark against it.
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks import micro, scenarios
+from benchmarks.environment import BenchEnvironment
+from benchmarks.stats import format_row
+from src.config.env import settings
+
+
+def git_revision() -> dict:
+    def git(*args: str) -> str:
+        return subprocess.run(['git', *args], capture_output=True, text=True, check=True).stdout.strip()
+
+    try:
+        return {'commit': git('rev-parse', 'HEAD'), 'dirty': bool(git('status', '--porcelain', '--untracked-files=no'))}
+    except (OSError, subprocess.CalledProcessError):
+        return {'commit': None, 'dirty': None}
+
+
+async def run(args: argparse.Namespace) -> dict:
+    results = {
+        **git_revision(),
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {
+            'iterations': args.iterations,
+            'hash_iterations': args.hash_iterations,
+            'users': args.users,
+            'workers': args.workers,
+            'requests': args.requests,
+            'bcrypt_rounds': settings.hashing.BCRYPT_ROUNDS,
+            'hashing_scheme': settings.hashing.SCHEME,
+            'hashing_executor': settings.hashing.EXECUTOR,
+            'algorithm': settings.auth.ALGORITHM,
+        },
+    }
+    if args.suite in ('all', 'micro'):
+        results['micro'] = await micro.run(args.iterations, args.hash_iterations)
+    if args.suite in ('all', 'scenarios'):
+        async with BenchEnvironment(args.users) as env:
+            results['scenarios'] = await scenarios.run(env, args.workers, args.requests)
+    return results
+
+
+def report(results: dict, baseline: dict | None) -> None:
+    for group in ('micro', 'scenarios'):
+        for name, result in results.get(group, {}).items():
+            line = format_row(name, result)
+            previous = (baseline or {}).get(group, {}).get(name)
+            if previous and previous['ops_per_sec']:
+                change = result['ops_per_sec'] / previous['ops_per_sec'] - 1
+                line += f'  {change:+7.1%} vs {(baseline["commit"] or "unknown")[:10]}'
+            print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('suite', nargs='?', choices=('all', 'micro', 'scenarios'), default='all')
+    parser.add_argument('--quick', action='store_true', help='a smoke run, too short for meaningful numbers')
+    parser.add_argument('--iterations', type=int, default=20_000, help='calls per CPU microbenchmark')
+    parser.add_argument('--hash-iterations', type=int, default=50, help='calls per password hashing benchmark')
+    parser.add_argument('--users', type=int, default=1000, help='seeded users')
+    parser.add_argument('--workers', type=int, default=50, help='concurrent clients per scenario')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per scenario')
+    parser.add_argument('--output', type=Path, help='save the results as JSON')
+    parser.add_argument('--compare', type=Path, help='JSON results of an earlier run to compare with')
+    args = parser.parse_args()
+    if args.quick:
+        args.iterations, args.hash_iterations, args.users, args.workers, args.requests = 500, 5, 50, 10, 100
+
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    results = asyncio.run(run(args))
+    report(results, baseline)
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Offline stand-ins for the services the app needs: SQLite through aiosqlite and an in-process fakeredis.
+
+Settings are read once, when `src` is first imported, so the defaults below are set before that. Any of them can be
+overridden from the environment, `HASHING__BCRYPT_ROUNDS` is pinned so results do not depend on startup calibration.
+Tokens are signed with RS256 like in production, from keys generated into a temporary directory for the run,
+`AUTH__ALGORITHM=HS256` measures the shared secret instead.
+"""
+
+import asyncio
+import os
+import tempfile
+from contextlib import suppress
+from pathlib import Path
+
+os.environ.setdefault('AUTH__SECRET_KEY', 'benchmark-secret-key-benchmark-secret-key')
+os.environ.setdefault('AUTH__ALGORITHM', 'RS256')
+if 'AUTH__KEYS_DIR' not in os.environ:
+    # removed when the interpreter exits
+    keys_dir = tempfile.TemporaryDirectory(prefix='auth-bench-keys-')
+    os.environ['AUTH__KEYS_DIR'] = keys_dir.name
+os.environ.setdefault('HASHING__BCRYPT_ROUNDS', '8')
+os.environ.setdefault('LOG__LEVEL', 'WARNING')
+# every request comes from the same address and the storms log the same users in over and over
+os.environ.setdefault('THROTTLE__IP_MAX_ATTEMPTS', '1000000000')
+os.environ.setdefault('THROTTLE__USER_MAX_ATTEMPTS', '1000000000')
+
+from fakeredis import FakeAsyncRedis  # noqa: E402
+from httpx import ASGITransport, AsyncClient  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine  # noqa: E402
+
+from src.auth.cache import user_cache  # noqa: E402
+from src.auth.logins import login_stats  # noqa: E402
+from src.auth.models import User  # noqa: E402
+from src.auth.repository import UserRepository  # noqa: E402
+from src.config.db import Base, RoutingSession, get_redis, get_session, instrument_engine  # noqa: E402
+from src.config.env import settings  # noqa: E402
+from src.config.keys import key_ring  # noqa: E402
+from src.config.security import PasswordHasher, configure_password_hashing, token_cache  # noqa: E402
+from src.main import app  # noqa: E402
+
+PASSWORD = 'password_123'
+
+
+def username(index: int) -> str:
+    return f'bench{index:06d}'
+
+
+class BenchEnvironment:
+    """The app wired to a fresh SQLite file and fakeredis, seeded with `users` users sharing one password.
+
+    Mirrors what the lifespan and the real dependencies do, except for the background tasks that only matter to a
+    long-running worker. The login bookkeeping loop does run, as it writes to the database behind every login.
+    """
+
+    def __init__(self, users: int) -> None:
+        self.users = users
+        self._tmpdir = tempfile.TemporaryDirectory(prefix='auth-bench-')
+        # a file, not :memory:, so concurrent requests get their own connections like they would against Postgres
+        self.engine = instrument_engine(
+            create_async_engine(f'sqlite+aiosqlite:///{Path(self._tmpdir.name) / "auth.db"}')
+        )
+        self.session_factory = async_sessionmaker(
+            bind=self.engine,
+            class_=AsyncSession,
+            sync_session_class=RoutingSession,
+            expire_on_commit=False,
+            autoflush=False,
+            autocommit=False,
+        )
+        self.redis = FakeAsyncRedis(decode_responses=True)
+        self.user_ids: list[int] = []
+        self._saved_state = None
+        self._login_stats_task: asyncio.Task | None = None
+
+    async def get_session(self):
+        async with self.session_factory() as session:
+            yield session
+            if session.in_transaction():
+                await session.commit()
+            for callback in session.info.pop('after_commit', []):
+                await callback()
+
+    async def get_redis(self):
+        yield self.redis
+
+    async def __aenter__(self) -> 'BenchEnvironment':
+        await asyncio.to_thread(configure_password_hashing)
+        if key_ring is not None:
+            # the first login would otherwise time generating the signing key
+            await asyncio.to_thread(key_ring.maintain)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        await self._seed()
+
+        self._saved_state = (app.state.redis, login_stats.session_factory)
+        app.state.redis = self.redis
+        app.dependency_overrides[get_session] = self.get_session
+        app.dependency_overrides[get_redis] = self.get_redis
+        login_stats.session_factory = self.session_factory
+        self._login_stats_task = asyncio.create_task(login_stats.run())
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._login_stats_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._login_stats_task
+        await login_stats.flush()
+
+        app.state.redis, login_stats.session_factory = self._saved_state
+        app.dependency_overrides.clear()
+        self.reset_caches()
+        await self.redis.aclose()
+        await self.engine.dispose()
+        self._tmpdir.cleanup()
+
+    async def _seed(self) -> None:
+        # one hash for everybody, seeding should not take longer than the benchmark
+        password = await PasswordHasher.get_password_hash(PASSWORD)
+        async with self.session_factory() as session:
+            repo = UserRepository(session)
+            batch_size = settings.imports.BATCH_SIZE
+            for start in range(0, self.users, batch_size):
+                end = min(start + batch_size, self.users)
+                await repo.bulk_create_users(
+                    [{'username': username(index), 'password': password} for index in range(start, end)]
+                )
+            await session.commit()
+            self.user_ids = list((await session.scalars(select(User.id).order_by(User.id))).all())
+
+    def client(self) -> AsyncClient:
+        return AsyncClient(transport=ASGITransport(app=app), base_url='http://bench/api/v1')
+
+    @staticmethod
+    def reset_caches() -> None:
+        """Drops process-local caches so one scenario does not warm up the next"""
+        token_cache.clear()
+        user_cache.clear()
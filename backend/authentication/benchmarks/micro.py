@@ -0,0 +1,89 @@
+"""Microbenchmarks of the CPU-bound building blocks: JWT encoding and decoding, password hashing, schema validation"""
+
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+from benchmarks.environment import PASSWORD
+from benchmarks.stats import summarize
+from src.auth.models import Group, Role, User
+from src.auth.schemas import SelfUserSchema, UserCreateSchema, UserLoginSchema, UserUpdateSchema
+from src.config.security import JwtToken, PasswordHasher, configure_password_hashing, token_cache
+
+TOKEN_DATA = {'sub': '42', 'role': Role.USER.value, 'groups': 'staff,support', 'fam': 'a' * 32}
+
+
+def measure(func: Callable[[], object], iterations: int) -> dict:
+    for _ in range(min(iterations, 100)):
+        func()
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return summarize(timings)
+
+
+async def measure_async(func: Callable[[], Awaitable], iterations: int) -> dict:
+    await func()
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await func()
+        timings.append(time.perf_counter() - started)
+    return summarize(timings)
+
+
+def jwt_benchmarks(iterations: int) -> dict[str, dict]:
+    token, _ = JwtToken.create_token(TOKEN_DATA, JwtToken.TokenType.ACCESS)
+    results = {'jwt_encode': measure(lambda: JwtToken.create_token(TOKEN_DATA, JwtToken.TokenType.ACCESS), iterations)}
+
+    # a zero-sized cache never stores, so every decode verifies the signature
+    maxsize, token_cache.maxsize = token_cache.maxsize, 0
+    try:
+        results['jwt_decode'] = measure(lambda: JwtToken.decode_token(token, JwtToken.TokenType.ACCESS), iterations)
+    finally:
+        token_cache.maxsize = maxsize
+    token_cache.clear()
+    results['jwt_decode_cached'] = measure(
+        lambda: JwtToken.decode_token(token, JwtToken.TokenType.ACCESS), iterations
+    )
+    token_cache.clear()
+    return results
+
+
+async def password_benchmarks(iterations: int) -> dict[str, dict]:
+    hashed = await PasswordHasher.get_password_hash(PASSWORD)
+    return {
+        'password_hash': await measure_async(lambda: PasswordHasher.get_password_hash(PASSWORD), iterations),
+        'password_verify': await measure_async(lambda: PasswordHasher.verify_password(PASSWORD, hashed), iterations),
+    }
+
+
+def schema_benchmarks(iterations: int) -> dict[str, dict]:
+    create = {'username': 'benchmark', 'password': PASSWORD, 'password_retry': PASSWORD}
+    update = {'email': 'bench@example.com', 'password': PASSWORD, 'password_retry': PASSWORD}
+    login = {'username': 'benchmark', 'password': PASSWORD}
+    user = User(
+        id=42,
+        username='benchmark',
+        email='bench@example.com',
+        role=Role.USER,
+        groups=[Group(id=1, name='staff'), Group(id=2, name='support')],
+    )
+    return {
+        'schema_user_create': measure(lambda: UserCreateSchema.model_validate(create), iterations),
+        'schema_user_update': measure(lambda: UserUpdateSchema.model_validate(update), iterations),
+        'schema_user_login': measure(lambda: UserLoginSchema.model_validate(login), iterations),
+        'schema_self_user_dump': measure(
+            lambda: SelfUserSchema.model_validate(user).model_dump(mode='json'), iterations
+        ),
+    }
+
+
+async def run(iterations: int, hash_iterations: int) -> dict[str, dict]:
+    await asyncio.to_thread(configure_password_hashing)
+    results = jwt_benchmarks(iterations)
+    results.update(await password_benchmarks(hash_iterations))
+    results.update(schema_benchmarks(iterations))
+    return results
@@ -0,0 +1,92 @@
+"""Cost of refresh-token rotation against the configured Redis.
+
+Compares the refresh transaction before rotation (blacklist the old access token, write the new session) with the
+rotating one, and reports the memory held by one family hash. Run with `python -m benchmarks.refresh_rotation`.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from uuid import uuid4
+
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+from redis.exceptions import ResponseError
+
+from src.auth.families import ROTATE_SCRIPT, refresh_families
+from src.config.env import settings
+
+
+def queue_writes(pipe: Pipeline) -> None:
+    jti = uuid4().hex
+    pipe.set(f'bench:blacklist:{uuid4().hex}', 'True', ex=60)
+    pipe.hset(f'bench:session:{jti}', mapping={'user_id': '1', 'groups': '', 'role': 'user'})
+    pipe.expire(f'bench:session:{jti}', 60)
+
+
+async def plain_refresh(redis: Redis, family: str) -> None:
+    async with redis.pipeline(transaction=True) as pipe:
+        queue_writes(pipe)
+        await pipe.execute()
+
+
+def rotating_refresh():
+    current = {}
+
+    async def run(redis: Redis, family: str) -> None:
+        new_jti = uuid4().hex
+        await refresh_families.rotate(redis, family, current.get(family, ''), new_jti, uuid4().hex, queue_writes)
+        current[family] = new_jti
+
+    return run
+
+
+async def measure(redis: Redis, refresh, families: list[str], rounds: int) -> list[float]:
+    async with redis.pipeline(transaction=False) as pipe:
+        for family in families:
+            refresh_families.start(pipe, family, '', '')
+        await pipe.execute()
+    timings = []
+    for _ in range(rounds):
+        for family in families:
+            started = time.perf_counter()
+            await refresh(redis, family)
+            timings.append(time.perf_counter() - started)
+    return timings
+
+
+def report(name: str, timings: list[float]) -> None:
+    timings = sorted(timings)
+    p99 = timings[int(len(timings) * 0.99) - 1]
+    print(
+        f'{name:<10} {len(timings) / sum(timings):>10.0f} ops/s  '
+        f'p50 {statistics.median(timings) * 1e6:>8.1f} us  p99 {p99 * 1e6:>8.1f} us'
+    )
+
+
+async def main(families: int, rounds: int) -> None:
+    redis = Redis(host=settings.redis.HOST, port=settings.redis.PORT, db=settings.redis.DB, decode_responses=True)
+    await redis.script_load(ROTATE_SCRIPT)
+    names = [f'bench-{uuid4().hex}' for _ in range(families)]
+    try:
+        report('plain', await measure(redis, plain_refresh, names, rounds))
+        report('rotating', await measure(redis, rotating_refresh(), names, rounds))
+        try:
+            print(f'family hash: {await redis.memory_usage(f"refresh:family:{names[0]}")} bytes')
+        except ResponseError:
+            print('family hash: MEMORY USAGE is not supported by this server')
+    finally:
+        async for key in redis.scan_iter('bench:*'):
+            await redis.delete(key)
+        for name in names:
+            await redis.delete(f'refresh:family:{name}')
+        await redis.aclose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.refresh_rotation')
+    parser.add_argument('--families', type=int, default=100)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.families, args.rounds))
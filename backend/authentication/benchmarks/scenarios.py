@@ -0,0 +1,75 @@
+"""End-to-end scenarios through the ASGI app: every request runs the middleware, routing, services and both stores"""
+
+import asyncio
+import itertools
+import time
+from typing import Awaitable, Callable
+
+from httpx import AsyncClient, Response
+
+from benchmarks.environment import PASSWORD, BenchEnvironment, username
+from benchmarks.stats import summarize
+
+Request = Callable[[AsyncClient, int], Awaitable[Response]]
+
+
+async def login(client: AsyncClient, index: int) -> Response:
+    return await client.post('/token/create/', json={'username': username(index), 'password': PASSWORD})
+
+
+async def refresh(client: AsyncClient, index: int) -> Response:
+    return await client.post('/token/refresh/')
+
+
+async def read_profile(client: AsyncClient, index: int) -> Response:
+    return await client.get('/users/me/')
+
+
+def read_user(env: BenchEnvironment) -> Request:
+    async def request(client: AsyncClient, index: int) -> Response:
+        return await client.get(f'/users/{env.user_ids[index % len(env.user_ids)]}/')
+
+    return request
+
+
+async def run_scenario(
+    env: BenchEnvironment, request: Request, expected_status: int, workers: int, requests: int, logged_in: bool
+) -> dict:
+    """Runs `requests` requests from `workers` concurrent clients, each client acting as one of the seeded users"""
+    env.reset_caches()
+    clients = [env.client() for _ in range(workers)]
+    try:
+        if logged_in:
+            for worker, client in enumerate(clients):
+                response = await login(client, worker % env.users)
+                assert response.status_code == 204, response.text
+
+        counter = itertools.count()
+        timings: list[float] = []
+        errors = 0
+
+        async def worker_loop(client: AsyncClient) -> None:
+            nonlocal errors
+            while (sent := next(counter)) < requests:
+                started = time.perf_counter()
+                response = await request(client, sent % env.users)
+                timings.append(time.perf_counter() - started)
+                if response.status_code != expected_status:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker_loop(client) for client in clients))
+        return summarize(timings, time.perf_counter() - started, errors)
+    finally:
+        for client in clients:
+            await client.aclose()
+
+
+async def run(env: BenchEnvironment, workers: int, requests: int) -> dict[str, dict]:
+    return {
+        'login_storm': await run_scenario(env, login, 204, workers, requests, logged_in=False),
+        # each client refreshes its own session, every refresh rotates the family it presents
+        'refresh_storm': await run_scenario(env, refresh, 204, workers, requests, logged_in=True),
+        'profile_reads': await run_scenario(env, read_profile, 200, workers, requests, logged_in=True),
+        'user_reads': await run_scenario(env, read_user(env), 200, workers, requests, logged_in=True),
+    }
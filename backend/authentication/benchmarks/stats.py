@@ -0,0 +1,29 @@
+import statistics
+
+
+def percentile(timings: list[float], share: float) -> float:
+    """Nearest-rank percentile of already sorted timings"""
+    return timings[max(int(round(len(timings) * share)) - 1, 0)]
+
+
+def summarize(timings: list[float], elapsed: float | None = None, errors: int = 0) -> dict:
+    """Throughput and latency in microseconds, `elapsed` is the wall time when operations ran concurrently"""
+    timings = sorted(timings)
+    elapsed = sum(timings) if elapsed is None else elapsed
+    return {
+        'operations': len(timings),
+        'errors': errors,
+        'ops_per_sec': round(len(timings) / elapsed, 1) if elapsed else 0.0,
+        'mean_us': round(statistics.fmean(timings) * 1e6, 1),
+        'p50_us': round(percentile(timings, 0.50) * 1e6, 1),
+        'p95_us': round(percentile(timings, 0.95) * 1e6, 1),
+        'p99_us': round(percentile(timings, 0.99) * 1e6, 1),
+    }
+
+
+def format_row(name: str, result: dict) -> str:
+    errors = f'  errors {result["errors"]}' if result['errors'] else ''
+    return (
+        f'{name:<22} {result["ops_per_sec"]:>10.0f} ops/s  p50 {result["p50_us"]:>10.1f} us  '
+        f'p95 {result["p95_us"]:>10.1f} us  p99 {result["p99_us"]:>10.1f} us{errors}'
+    )
@@ -0,0 +1,175 @@
+import asyncio
+import hashlib
+import logging
+import math
+import time
+
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+from redis.exceptions import RedisError
+
+from src.config.env import settings
+from src.metrics import registry
+
+log = logging.getLogger(__name__)
+
+filter_negatives = registry.counter('auth_blacklist_filter_negatives_total', 'Revocation checks answered by the local filter')
+filter_positives = registry.counter('auth_blacklist_filter_positives_total', 'Revocation checks forwarded to Redis')
+filter_false_positives = registry.counter(
+    'auth_blacklist_filter_false_positives_total', 'Filter positives that Redis did not confirm'
+)
+blacklist_size = registry.gauge('auth_blacklist_entries', 'Revoked tokens that have not expired yet')
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float, max_bytes: int) -> None:
+        bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.size = max(8, min(bits, max_bytes * 8))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray(math.ceil(self.size / 8))
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8])
+        second = int.from_bytes(digest[8:]) | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationFilter:
+    """Local Bloom filter of revoked access token JTIs, fed from the `blacklist:stream` Redis stream.
+
+    A negative answer means the JTI was not revoked as of the last sync, so only positives need a Redis lookup.
+    Until the whole stream has been read every JTI is reported as a positive.
+    """
+
+    STREAM_KEY = 'blacklist:stream'
+
+    def __init__(self, capacity: int, error_rate: float, max_bytes: int, sync_interval_ms: int) -> None:
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.max_bytes = max_bytes
+        self.sync_interval = sync_interval_ms / 1000
+        self.page_size = 1000
+        self.rebuild_interval = 60
+        self.rebuilt_at = -math.inf
+        self.reset()
+
+    def reset(self) -> None:
+        self.filter = BloomFilter(self.capacity, self.error_rate, self.max_bytes)
+        self.last_id = '0-0'
+        self.synced_at = -math.inf
+        self.ready = False
+
+    @property
+    def sync_due(self) -> bool:
+        return time.monotonic() - self.synced_at >= self.sync_interval
+
+    def queue_sync(self, pipe: Pipeline) -> None:
+        pipe.xread({self.STREAM_KEY: self.last_id}, count=self.page_size)
+
+    def apply_sync(self, response) -> None:
+        entries = response[0][1] if response else []
+        for entry_id, fields in entries:
+            self.filter.add(fields['jti'])
+            self.last_id = entry_id
+
+        self.ready = len(entries) < self.page_size
+        # keep paging on the next request until the stream is drained
+        self.synced_at = time.monotonic() if self.ready else -math.inf
+
+        # the stream is trimmed to live tokens, so re-reading it drops revocations that already expired
+        if self.ready and self.filter.count > self.capacity and time.monotonic() - self.rebuilt_at >= self.rebuild_interval:
+            log.warning('Revocation filter exceeded capacity of %s, rebuilding from the stream', self.capacity)
+            self.rebuilt_at = time.monotonic()
+            self.reset()
+
+    def add(self, jti: str) -> None:
+        self.filter.add(jti)
+
+    def might_be_revoked(self, jti: str) -> bool:
+        if self.ready and jti not in self.filter:
+            filter_negatives.inc()
+            return False
+        filter_positives.inc()
+        return True
+
+    def publish(self, pipe: Pipeline, jti: str) -> None:
+        # only access tokens are checked against the filter, the stream holds them for as long as one can live
+        retention_ms = settings.auth.ACCESS_TOKEN_EXPIRE_MIN * 60 * 1000
+        min_id = int(time.time() * 1000) - retention_ms
+        pipe.xadd(self.STREAM_KEY, {'jti': jti}, minid=min_id, approximate=True)
+        self.add(jti)
+
+
+class TokenBlacklist:
+    """Revoked JTIs, bucketed by the minute their token expires in.
+
+    A bucket is one hash of truncated JTI digests that expires right after the last token it can hold, so memory follows
+    the revoked tokens that are still alive rather than the total logout volume. `blacklist:buckets` lists the buckets
+    for the size gauge.
+    """
+
+    BUCKETS_KEY = 'blacklist:buckets'
+
+    def __init__(self, size_interval_sec: int) -> None:
+        self.size_interval = size_interval_sec
+        self.buckets_ttl = settings.auth.REFRESH_TOKEN_EXPIRE_DAY * 24 * 60 * 60
+
+    @staticmethod
+    def entry(jti: str, exp: int) -> tuple[str, str]:
+        # 64-bit digests, a collision would need billions of live revocations
+        return f'blacklist:{exp // 60}', hashlib.blake2b(jti.encode(), digest_size=8).hexdigest()
+
+    def add(self, pipe: Pipeline, jti: str, exp: int) -> None:
+        if exp <= time.time():
+            # expired tokens are rejected on decode already
+            return
+        key, field = self.entry(jti, exp)
+        minute = exp // 60
+        pipe.hset(key, field, '1')
+        pipe.expireat(key, (minute + 1) * 60 + 1)
+        pipe.zadd(self.BUCKETS_KEY, {key: minute})
+        pipe.expire(self.BUCKETS_KEY, self.buckets_ttl)
+
+    async def contains(self, redis: Redis, jti: str, exp: int) -> bool:
+        return bool(await redis.hexists(*self.entry(jti, exp)))
+
+    async def measure(self, redis: Redis) -> int:
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.zremrangebyscore(self.BUCKETS_KEY, '-inf', f'({int(time.time()) // 60}')
+            pipe.zrange(self.BUCKETS_KEY, 0, -1)
+            _, keys = await pipe.execute()
+        size = 0
+        if keys:
+            async with redis.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.hlen(key)
+                size = sum(await pipe.execute())
+        blacklist_size.set(size)
+        return size
+
+    async def run(self, redis: Redis) -> None:
+        while True:
+            try:
+                await self.measure(redis)
+            except RedisError as redis_error:
+                log.error('redis error while measuring the blacklist: %s', redis_error)
+            await asyncio.sleep(self.size_interval)
+
+
+revocation_filter = RevocationFilter(
+    settings.blacklist.FILTER_CAPACITY,
+    settings.blacklist.FILTER_ERROR_RATE,
+    settings.blacklist.FILTER_MAX_BYTES,
+    settings.blacklist.FILTER_SYNC_INTERVAL_MS,
+)
+token_blacklist = TokenBlacklist(settings.blacklist.SIZE_INTERVAL_SEC)
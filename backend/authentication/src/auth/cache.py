@@ -0,0 +1,197 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+from src.config.env import settings
+from src.metrics import registry
+
+log = logging.getLogger(__name__)
+
+user_cache_local_hits = registry.counter('auth_user_cache_local_hits_total', 'User reads served from process memory')
+user_cache_redis_hits = registry.counter('auth_user_cache_redis_hits_total', 'User reads served from Redis')
+user_cache_loads = registry.counter('auth_user_cache_loads_total', 'User reads that went to the database')
+
+Loader = Callable[[], Awaitable[dict | None]]
+
+
+class UserCache:
+    """Read-through cache of serialized user views: process-local LRU in front of a `user:{id}` Redis hash.
+
+    Each hash field is one view (`public`, `self`), so a single DEL drops every view of a user. Invalidations are
+    published on `CHANNEL` and evicted from the local tier of every worker by `listen`. A user that does not exist is
+    cached as `null` for `miss_ttl_ms`, so workers waiting on the load lock get the answer too.
+    """
+
+    CHANNEL = 'user:invalidate'
+
+    def __init__(
+        self, local_size: int, local_ttl: int, redis_ttl: int, lock_ttl_ms: int, miss_ttl_ms: int = 1000
+    ) -> None:
+        self.local_size = local_size
+        self.local_ttl = local_ttl
+        self.redis_ttl = redis_ttl
+        self.lock_ttl_ms = lock_ttl_ms
+        self.miss_ttl_ms = miss_ttl_ms
+        self.lock_poll_interval = 0.05
+        self._local: OrderedDict[tuple[int, str], tuple[float, dict]] = OrderedDict()
+        self._inflight: dict[tuple[int, str], asyncio.Future] = {}
+        # bumped on every eviction, so loads that raced an invalidation are not kept locally
+        self._generation = 0
+
+    @staticmethod
+    def key(user_id: int) -> str:
+        return f'user:{user_id}'
+
+    def _get_local(self, local_key: tuple[int, str]) -> dict | None:
+        entry = self._local.get(local_key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._local[local_key]
+            return None
+        self._local.move_to_end(local_key)
+        return value
+
+    def _set_local(self, local_key: tuple[int, str], value: dict) -> None:
+        if not self.local_size:
+            return
+        self._local[local_key] = (time.monotonic() + self.local_ttl, value)
+        self._local.move_to_end(local_key)
+        while len(self._local) > self.local_size:
+            self._local.popitem(last=False)
+
+    def evict_local(self, user_id: int) -> None:
+        self._generation += 1
+        for view in [view for cached_id, view in self._local if cached_id == user_id]:
+            del self._local[(user_id, view)]
+
+    def clear(self) -> None:
+        self._local.clear()
+        self._generation += 1
+
+    async def get(self, redis: Redis, user_id: int, view: str, loader: Loader) -> dict | None:
+        local_key = (user_id, view)
+        value = self._get_local(local_key)
+        if value is not None:
+            user_cache_local_hits.inc()
+            return value
+
+        # single flight: concurrent misses for the same key share one load
+        inflight = self._inflight.get(local_key)
+        if inflight is not None:
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+            # the leading request was cancelled, load on our own
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[local_key] = future
+        generation = self._generation
+        try:
+            value = await self._get_shared(redis, user_id, view, loader)
+            if value is not None and self._generation == generation:
+                self._set_local(local_key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as error:
+            future.set_exception(error)
+            # the exception is re-raised here, waiters retrieve it from the future
+            future.exception()
+            raise
+        finally:
+            if self._inflight.get(local_key) is future:
+                del self._inflight[local_key]
+
+    async def _get_shared(self, redis: Redis, user_id: int, view: str, loader: Loader) -> dict | None:
+        key = self.key(user_id)
+        lock_key = f'{key}:lock:{view}'
+        try:
+            cached = await redis.hget(key, view)
+            if cached is not None:
+                user_cache_redis_hits.inc()
+                return json.loads(cached)
+
+            # cross-worker single flight: only the lock holder loads, others wait for its write
+            if not await redis.set(lock_key, '1', nx=True, px=self.lock_ttl_ms):
+                deadline = time.monotonic() + self.lock_ttl_ms / 1000
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(self.lock_poll_interval)
+                    async with redis.pipeline(transaction=False) as pipe:
+                        pipe.hget(key, view)
+                        pipe.exists(lock_key)
+                        cached, locked = await pipe.execute()
+                    if cached is not None:
+                        user_cache_redis_hits.inc()
+                        return json.loads(cached)
+                    if not locked:
+                        # the holder failed without writing, there is nothing left to wait for
+                        break
+                return await self._load(loader)
+        except RedisError as redis_error:
+            log.error('redis error while reading user cache: %s', redis_error)
+            return await self._load(loader)
+
+        loaded = False
+        try:
+            value = await self._load(loader)
+            loaded = True
+            return value
+        finally:
+            # released whatever the loader did, waiters would otherwise sit out the whole lock ttl
+            try:
+                async with redis.pipeline(transaction=True) as pipe:
+                    if loaded and value is not None:
+                        pipe.hset(key, view, json.dumps(value))
+                        pipe.expire(key, self.redis_ttl)
+                    elif loaded:
+                        pipe.hset(key, view, 'null')
+                        pipe.pexpire(key, self.miss_ttl_ms)
+                    pipe.delete(lock_key)
+                    await pipe.execute()
+            except RedisError as redis_error:
+                log.error('redis error while writing user cache: %s', redis_error)
+
+    async def _load(self, loader: Loader) -> dict | None:
+        user_cache_loads.inc()
+        return await loader()
+
+    async def invalidate(self, redis: Redis, user_id: int) -> None:
+        self.evict_local(user_id)
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.delete(self.key(user_id))
+            pipe.publish(self.CHANNEL, str(user_id))
+            await pipe.execute()
+
+    async def listen(self, redis: Redis) -> None:
+        while True:
+            try:
+                async with redis.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(self.CHANNEL)
+                    # invalidations may have been missed while disconnected
+                    self.clear()
+                    async for message in pubsub.listen():
+                        self.evict_local(int(message['data']))
+            except RedisError as redis_error:
+                log.error('user cache invalidation listener failed: %s', redis_error)
+                await asyncio.sleep(1)
+
+
+user_cache = UserCache(
+    settings.cache.USER_LOCAL_SIZE,
+    settings.cache.USER_LOCAL_TTL_SEC,
+    settings.cache.USER_REDIS_TTL_SEC,
+    settings.cache.USER_LOCK_TTL_MS,
+    settings.cache.USER_MISS_TTL_MS,
+)
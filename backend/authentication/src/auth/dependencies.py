@@ -1,17 +1,19 @@
 from typing import Annotated, TypeAlias
 
-from fastapi import Depends, Request
+from fastapi import Depends, HTTPException, Request
 from redis import Redis
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.auth.models import Role
 from src.auth.service import TokenService, UserService
 from src.config.db import get_session, get_redis
+from src.middleware import AuthUser
 
 DatabaseDep: TypeAlias = Annotated[AsyncSession, Depends(get_session)]
 RedisDep: TypeAlias = Annotated[Redis, Depends(get_redis)]
 
-def get_user_service(db: DatabaseDep) -> UserService:
-    return UserService(db)
+def get_user_service(db: DatabaseDep, redis: RedisDep) -> UserService:
+    return UserService(db, redis)
 UserServiceDep: TypeAlias = Annotated[UserService, Depends(get_user_service)]
 
 
@@ -20,3 +22,15 @@ def get_token_service(redis: RedisDep, user_service: UserServiceDep) -> TokenSer
 TokenServiceDep: TypeAlias = Annotated[TokenService, Depends(get_token_service)]
 
 
+def get_auth_user(request: Request) -> AuthUser:
+    if request.auth is None:
+        raise HTTPException(401, 'Not authenticated')
+    return request.auth
+AuthDep: TypeAlias = Annotated[AuthUser, Depends(get_auth_user)]
+
+
+def get_admin_user(auth: AuthDep) -> AuthUser:
+    if auth.role != Role.ADMIN:
+        raise HTTPException(403, 'Not enough permissions')
+    return auth
+AdminDep: TypeAlias = Annotated[AuthUser, Depends(get_admin_user)]
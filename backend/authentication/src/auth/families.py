@@ -0,0 +1,163 @@
+import logging
+import time
+from enum import IntEnum
+from typing import Callable
+
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+from redis.commands.core import AsyncScript
+from redis.exceptions import NoScriptError
+
+from src.config.env import settings
+from src.metrics import registry
+
+log = logging.getLogger(__name__)
+
+refresh_rotations = registry.counter('auth_refresh_rotations_total', 'Refresh tokens exchanged for a new pair')
+refresh_reuses = registry.counter('auth_refresh_reuses_total', 'Replayed refresh tokens that revoked their family')
+
+# KEYS: family hash
+# ARGV: presented refresh jti, new refresh jti, new access jti, family ttl ms, '1' if a missing family may be started
+# returns {status} or, when the family was just revoked for reuse, {status, access jti of the current holder}
+ROTATE_SCRIPT = b"""
+local family = redis.call('HMGET', KEYS[1], 'current', 'access', 'revoked')
+local current, access, revoked = family[1], family[2], family[3]
+if revoked or (not current and ARGV[5] ~= '1') then
+    return {0}
+end
+if current and current ~= ARGV[1] then
+    redis.call('HSET', KEYS[1], 'revoked', '1')
+    return {-1, access}
+end
+redis.call('HSET', KEYS[1], 'current', ARGV[2], 'access', ARGV[3])
+redis.call('PEXPIRE', KEYS[1], ARGV[4])
+return {1}
+"""
+
+
+class Rotation(IntEnum):
+    ROTATED = 1
+    REJECTED = 0
+    REUSED = -1
+
+
+class RefreshFamilies:
+    """Refresh-token families, one Redis hash per login holding the only refresh jti that may still be exchanged.
+
+    Presenting any other refresh token of a family is a replay: the family is revoked, so neither the attacker nor the
+    legitimate holder can refresh again. The hash expires with the last refresh token issued in it.
+
+    A family is what a user sees as a session. `sessions:{user_id}` indexes them by expiry, so listing and revoking the
+    sessions of a user never scans the keyspace.
+    """
+
+    def __init__(self, ttl_sec: int) -> None:
+        self.ttl_ms = ttl_sec * 1000
+        self._script = AsyncScript(None, ROTATE_SCRIPT)
+
+    @staticmethod
+    def _key(family: str) -> str:
+        return f'refresh:family:{family}'
+
+    @staticmethod
+    def _index_key(user_id: int) -> str:
+        return f'sessions:{user_id}'
+
+    def start(self, pipe: Pipeline, family: str, refresh_jti: str, access_jti: str) -> None:
+        key = self._key(family)
+        pipe.hset(key, mapping={'current': refresh_jti, 'access': access_jti, 'created': int(time.time())})
+        pipe.pexpire(key, self.ttl_ms)
+
+    def revoke(self, pipe: Pipeline, family: str) -> None:
+        key = self._key(family)
+        pipe.hset(key, 'revoked', '1')
+        pipe.pexpire(key, self.ttl_ms)
+
+    def index(self, pipe: Pipeline, user_id: int, family: str) -> None:
+        """Scores the family in the user's index with its expiry, dropping entries that already expired"""
+        key = self._index_key(user_id)
+        now_ms = int(time.time() * 1000)
+        pipe.zremrangebyscore(key, '-inf', now_ms)
+        pipe.zadd(key, {family: now_ms + self.ttl_ms})
+        pipe.pexpire(key, self.ttl_ms)
+
+    async def list_sessions(self, redis: Redis, user_id: int) -> list[dict]:
+        now_ms = int(time.time() * 1000)
+        families = await redis.zrangebyscore(self._index_key(user_id), now_ms, '+inf', withscores=True)
+        if not families:
+            return []
+        async with redis.pipeline(transaction=False) as pipe:
+            for family, _ in families:
+                pipe.hmget(self._key(family), 'current', 'created', 'revoked')
+            states = await pipe.execute()
+        return [
+            # families started by a pre-family refresh token have no creation time
+            {'id': family, 'created_at': created and int(created), 'expires_at': int(expires_ms) // 1000}
+            for (family, expires_ms), (current, created, revoked) in zip(families, states)
+            if current is not None and revoked is None
+        ]
+
+    async def revoke_sessions(self, redis: Redis, user_id: int, family: str | None = None) -> int:
+        """Revokes one or all families of the user together with their access sessions, returns how many"""
+        index_key = self._index_key(user_id)
+        if family is None:
+            families = await redis.zrange(index_key, 0, -1)
+        else:
+            families = [family] if await redis.zscore(index_key, family) is not None else []
+        if not families:
+            return 0
+
+        async with redis.pipeline(transaction=False) as pipe:
+            for revoked in families:
+                pipe.hget(self._key(revoked), 'access')
+            access_jtis = await pipe.execute()
+
+        async with redis.pipeline(transaction=True) as pipe:
+            for revoked, access_jti in zip(families, access_jtis):
+                self.revoke(pipe, revoked)
+                if access_jti:
+                    pipe.delete(f'session:{access_jti}')
+            pipe.zrem(index_key, *families)
+            await pipe.execute()
+        log.info('Revoked %s sessions of user %s', len(families), user_id)
+        return len(families)
+
+    async def rotate(
+        self,
+        redis: Redis,
+        family: str,
+        refresh_jti: str,
+        new_refresh_jti: str,
+        new_access_jti: str,
+        queue_writes: Callable[[Pipeline], None],
+        legacy: bool = False,
+    ) -> tuple[Rotation, str | None]:
+        """Rotates the family in the same transaction as `queue_writes`, which runs whatever the outcome.
+
+        Tokens issued before families existed carry no family claim, `legacy` lets their own jti start one.
+        """
+        args = [refresh_jti, new_refresh_jti, new_access_jti, self.ttl_ms, '1' if legacy else '0']
+        try:
+            result = await self._execute(redis, family, args, queue_writes)
+        except NoScriptError:
+            # the pipeline would otherwise ask SCRIPT EXISTS before every transaction, so only a miss pays for a load
+            await redis.script_load(ROTATE_SCRIPT)
+            result = await self._execute(redis, family, args, queue_writes)
+
+        status = Rotation(int(result[0]))
+        if status == Rotation.ROTATED:
+            refresh_rotations.inc()
+        elif status == Rotation.REUSED:
+            refresh_reuses.inc()
+            log.warning('Refresh token reused, family %s revoked', family)
+        return status, result[1] if len(result) > 1 else None
+
+    async def _execute(self, redis: Redis, family: str, args: list, queue_writes: Callable[[Pipeline], None]) -> list:
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.evalsha(self._script.sha, 1, self._key(family), *args)
+            queue_writes(pipe)
+            result, *_ = await pipe.execute()
+        return result
+
+
+refresh_families = RefreshFamilies(settings.auth.REFRESH_TOKEN_EXPIRE_DAY * 24 * 60 * 60)
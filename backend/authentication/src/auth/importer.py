@@ -0,0 +1,180 @@
+import codecs
+import csv
+import json
+import logging
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Literal
+
+from pydantic import ValidationError
+
+from src.auth.repository import UserRepository
+from src.auth.schemas import UserImportErrorSchema, UserImportReportSchema, UserImportRowSchema
+from src.config.security import HashingPool, PasswordHasher
+
+log = logging.getLogger(__name__)
+
+ImportFormat = Literal['csv', 'ndjson']
+# row number, parsed fields, parse error
+ParsedRow = tuple[int, Any, str | None]
+# a quoted field may span lines, one left open swallows the lines after it
+MAX_CSV_RECORD_LINES = 100
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    buffer = ''
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split('\n')
+        for line in lines:
+            yield line.rstrip('\r')
+    buffer += decoder.decode(b'', final=True)
+    if buffer:
+        yield buffer.rstrip('\r')
+
+
+def _parse_csv_record(lines: list[str]) -> list[str] | None:
+    """Values of the record spread over `lines`, None while a quoted field is still open"""
+    reader = csv.reader([*(line + '\n' for line in lines), ''])
+    values = next(reader, [])
+    # an open field runs on into the empty line after the record
+    return values if reader.line_num <= len(lines) else None
+
+
+async def read_csv_records(lines: AsyncIterable[str]) -> AsyncIterator[list[str] | None]:
+    """Yields the values of every CSV record, a quoted field may span lines.
+
+    A field still open after `MAX_CSV_RECORD_LINES` lines yields None and is dropped, so a stray quote cannot pull the
+    rest of the file into memory.
+    """
+    pending: list[str] = []
+    async for line in lines:
+        if not pending and not line.strip():
+            continue
+        pending.append(line)
+        # a line without quotes cannot close a field opened on an earlier one
+        values = _parse_csv_record(pending) if len(pending) == 1 or '"' in line else None
+        if values is not None:
+            pending = []
+            yield values
+        elif len(pending) >= MAX_CSV_RECORD_LINES:
+            pending = []
+            yield None
+    if pending:
+        # unterminated at the end of the stream, csv closes the field
+        yield next(csv.reader(['\n'.join(pending)]))
+
+
+async def read_rows(lines: AsyncIterable[str], format: ImportFormat) -> AsyncIterator[ParsedRow]:
+    """Yields data rows numbered from 1, blank lines and the CSV header are not counted"""
+    row = 0
+    if format == 'csv':
+        header = None
+        async for values in read_csv_records(lines):
+            if header is None:
+                header = [name.strip() for name in values or []]
+                continue
+            row += 1
+            if values is None:
+                yield row, None, f'Quoted field not closed within {MAX_CSV_RECORD_LINES} lines'
+            elif len(values) != len(header):
+                yield row, None, f'Expected {len(header)} columns, got {len(values)}'
+            else:
+                # empty cells are missing values, not empty strings
+                yield row, {name: value or None for name, value in zip(header, values)}, None
+        return
+
+    async for line in lines:
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            yield row, json.loads(line), None
+        except json.JSONDecodeError as decode_error:
+            yield row, None, f'Malformed JSON: {decode_error.msg}'
+
+
+def _describe(validation_error: ValidationError) -> str:
+    return '; '.join(
+        f'{".".join(map(str, error["loc"]))}: {error["msg"]}' if error['loc'] else error['msg']
+        for error in validation_error.errors()
+    )
+
+
+class UserImporter:
+    """Creates users from a CSV or NDJSON stream with one multi-row insert and one commit per batch.
+
+    Invalid rows and rows clashing with an existing username or email are reported and skipped. `report.processed`
+    counts committed rows, a failed import is resumed by passing it back as `skip`.
+    """
+
+    def __init__(
+        self,
+        repo: UserRepository,
+        pool: HashingPool,
+        batch_size: int,
+        on_checkpoint: Callable[[int], Awaitable[None]] | None = None,
+        max_hash_workers: int | None = None,
+    ) -> None:
+        self.repo = repo
+        self.pool = pool
+        self.max_hash_workers = max_hash_workers
+        self.batch_size = batch_size
+        self.on_checkpoint = on_checkpoint
+        self.report = UserImportReportSchema()
+
+    async def run(self, lines: AsyncIterable[str], format: ImportFormat, skip: int = 0) -> UserImportReportSchema:
+        self.report.processed = skip
+        batch: list[ParsedRow] = []
+        async for parsed in read_rows(lines, format):
+            if parsed[0] <= skip:
+                continue
+            batch.append(parsed)
+            if len(batch) >= self.batch_size:
+                await self._import_batch(batch)
+                batch = []
+        if batch:
+            await self._import_batch(batch)
+        return self.report
+
+    async def _import_batch(self, batch: list[ParsedRow]) -> None:
+        errors = []
+        valid: list[tuple[int, UserImportRowSchema]] = []
+        for row, fields, error in batch:
+            if error is None:
+                try:
+                    valid.append((row, UserImportRowSchema.model_validate(fields)))
+                    continue
+                except ValidationError as validation_error:
+                    error = _describe(validation_error)
+            username = fields.get('username') if isinstance(fields, dict) else None
+            errors.append(UserImportErrorSchema(row=row, username=username and str(username), error=error))
+
+        if valid:
+            hashes = await PasswordHasher.get_password_hashes(
+                [user.password for _, user in valid], self.pool, self.max_hash_workers
+            )
+            created = await self.repo.bulk_create_users(
+                [
+                    {'username': user.username, 'password': password_hash, 'email': user.email}
+                    for (_, user), password_hash in zip(valid, hashes)
+                ]
+            )
+            await self.repo.db.commit()
+
+            for row, user in valid:
+                # a username repeated within the batch is inserted once
+                if user.username in created:
+                    created.discard(user.username)
+                    self.report.created += 1
+                else:
+                    errors.append(
+                        UserImportErrorSchema(
+                            row=row, username=user.username, error='User with this username or email already exists'
+                        )
+                    )
+
+        self.report.errors.extend(sorted(errors, key=lambda error: error.row))
+        self.report.processed = batch[-1][0]
+        log.debug('Imported users up to row %s', self.report.processed)
+        if self.on_checkpoint is not None:
+            await self.on_checkpoint(self.report.processed)
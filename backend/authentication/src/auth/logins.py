@@ -0,0 +1,90 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.auth.repository import UserRepository
+from src.config.db import async_session
+from src.config.env import settings
+from src.metrics import registry
+
+log = logging.getLogger(__name__)
+
+login_stats_pending = registry.gauge('auth_login_stats_pending', 'Users with logins not yet written to the database')
+login_stats_flushes = registry.counter('auth_login_stats_flushes_total', 'Bulk updates of login bookkeeping')
+login_stats_failures = registry.counter(
+    'auth_login_stats_failures_total', 'Failed bulk updates of login bookkeeping, retried on the next flush'
+)
+
+# three bound parameters per row keep a statement well under the 32767 limit
+FLUSH_BATCH_SIZE = 5000
+
+
+class LoginStats:
+    """Write-behind buffer for `latest_login` and `login_count`, so a login adds no UPDATE or row lock.
+
+    Logins are folded per user in memory and written with one bulk UPDATE per flush. Every worker keeps its own buffer,
+    the update only moves `latest_login` forward and adds to `login_count`, so concurrent flushes commute. Logins
+    buffered by a worker that dies without draining are lost.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession], flush_interval: float, max_pending: int):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: dict[int, tuple[datetime, int]] = {}
+        self._flush_due = asyncio.Event()
+        self._lock = asyncio.Lock()
+
+    def record(self, user_id: int) -> None:
+        # the column is naive UTC
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        _, count = self._pending.get(user_id, (now, 0))
+        self._pending[user_id] = (now, count + 1)
+        login_stats_pending.set(len(self._pending))
+        if len(self._pending) >= self.max_pending:
+            self._flush_due.set()
+
+    def _merge(self, logins: dict[int, tuple[datetime, int]]) -> None:
+        for user_id, (latest, count) in logins.items():
+            pending_latest, pending_count = self._pending.get(user_id, (latest, 0))
+            self._pending[user_id] = (max(latest, pending_latest), count + pending_count)
+        login_stats_pending.set(len(self._pending))
+
+    async def flush(self) -> int:
+        """Writes out everything recorded so far, returns the number of users updated"""
+        async with self._lock:
+            logins, self._pending = self._pending, {}
+            login_stats_pending.set(0)
+            if not logins:
+                return 0
+            rows = [(user_id, latest, count) for user_id, (latest, count) in logins.items()]
+            try:
+                async with self.session_factory() as session:
+                    repo = UserRepository(session)
+                    for start in range(0, len(rows), FLUSH_BATCH_SIZE):
+                        await repo.record_logins(rows[start : start + FLUSH_BATCH_SIZE])
+                    await session.commit()
+            except (SQLAlchemyError, OSError) as db_error:
+                login_stats_failures.inc()
+                log.error('Failed to flush logins of %s users, retrying later: %s', len(rows), db_error)
+                self._merge(logins)
+                return 0
+            login_stats_flushes.inc()
+            log.debug('Flushed logins of %s users', len(rows))
+            return len(rows)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_due.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_due.clear()
+            # cancelling the loop on shutdown must not drop a batch that is being written
+            await asyncio.shield(self.flush())
+
+
+login_stats = LoginStats(async_session, settings.logins.FLUSH_INTERVAL_SEC, settings.logins.MAX_PENDING)
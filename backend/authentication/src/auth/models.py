@@ -2,7 +2,7 @@ from datetime import date, datetime
 from enum import Enum as PyEnum
 from typing import Optional
 
-from sqlalchemy import Boolean, Date, DateTime, Enum, ForeignKey, String
+from sqlalchemy import Boolean, Date, DateTime, Enum, ForeignKey, Integer, String
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from src.config.db import Base
@@ -38,5 +38,6 @@ class User(Base):
     groups: Mapped[list['Group']] = relationship('Group', secondary='users_groups', back_populates='users')
 
     latest_login: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    login_count: Mapped[int] = mapped_column(Integer, default=0, server_default='0')
     latest_password_change: Mapped[Optional[date]] = mapped_column(Date)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
\ No newline at end of file
@@ -1,8 +1,12 @@
-from sqlalchemy import select
+from datetime import datetime
+from typing import AsyncIterator, Sequence
+
+from sqlalchemy import DateTime, Integer, Row, Select, case, column, insert, select, update, values
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload, selectinload
 
-from src.auth.models import User
+from src.auth.models import Group, Role, User
 
 
 class UserRepository:
@@ -10,11 +14,35 @@ class UserRepository:
         self.db = db
 
     async def create_user(self, username: str, password: str) -> User:
-        user = User(username=username, password=password)
-        self.db.add(user)
-        await self.db.flush()
-        await self.db.refresh(user)
-        return user
+        return await self.db.scalar(insert(User).values(username=username, password=password).returning(User))
+
+    async def bulk_create_users(self, users: Sequence[dict]) -> set[str]:
+        """Inserts every user in one statement, rows clashing with an existing username or email are skipped"""
+        insert = postgresql.insert if self.db.get_bind().dialect.name == 'postgresql' else sqlite.insert
+        query = insert(User).values(list(users)).on_conflict_do_nothing().returning(User.username)
+        return set((await self.db.scalars(query)).all())
+
+    async def record_logins(self, logins: Sequence[tuple[int, datetime, int]]) -> None:
+        """Applies (user id, latest login, login count) rows in one UPDATE ... FROM (VALUES ...)"""
+        rows = values(
+            column('id', Integer), column('latest_login', DateTime), column('logins', Integer), name='logins'
+        ).data(sorted(logins))
+        if self.db.get_bind().dialect.name != 'postgresql':
+            # SQLite takes no column names on a VALUES alias, only on a CTE
+            rows = rows.cte('logins')
+        await self.db.execute(
+            update(User)
+            .where(User.id == rows.c.id)
+            .values(
+                latest_login=case(
+                    (User.latest_login.is_(None), rows.c.latest_login),
+                    (rows.c.latest_login > User.latest_login, rows.c.latest_login),
+                    else_=User.latest_login,
+                ),
+                login_count=User.login_count + rows.c.logins,
+            )
+            .execution_options(synchronize_session=False)
+        )
 
     async def get_user(self, user_id: int) -> User | None:
         return await self.db.scalar(select(User).where(User.id == user_id))
@@ -33,16 +61,53 @@ class UserRepository:
                 selectinload(getattr(User, 'groups')),
             ))
 
+    async def get_users(self, user_ids: Sequence[int]) -> Sequence[User]:
+        result = await self.db.scalars(
+            select(User)
+            .where(User.id.in_(user_ids))
+            .options(
+                selectinload(getattr(User, 'groups')),
+            ),
+        )
+        return result.all()
+
+    @staticmethod
+    def _filter_users(
+        query: Select, after: int | None, role: Role | None, is_active: bool | None, group: str | None
+    ) -> Select:
+        if after is not None:
+            query = query.where(User.id > after)
+        if role is not None:
+            query = query.where(User.role == role)
+        if is_active is not None:
+            query = query.where(User.is_active == is_active)
+        if group is not None:
+            query = query.where(getattr(User, 'groups').any(Group.name == group))
+        return query.order_by(User.id)
+
+    async def list_users(self, limit: int, **filters) -> Sequence[User]:
+        return (await self.db.scalars(self._filter_users(select(User), **filters).limit(limit))).all()
+
+    async def stream_users(self, batch_size: int = 1000, **filters) -> AsyncIterator[Row]:
+        query = self._filter_users(
+            select(User.id, User.username, User.email, User.role, User.is_active), **filters
+        ).execution_options(yield_per=batch_size)
+        if not self.db.in_transaction():
+            # server-side cursors only live inside a transaction and read-only sessions run in autocommit, so a fresh
+            # session streams on a connection of its own isolation level, which also gives the export one snapshot
+            isolation_level = 'REPEATABLE READ' if self.db.get_bind().dialect.name == 'postgresql' else 'SERIALIZABLE'
+            await self.db.connection(execution_options={'isolation_level': isolation_level})
+        result = await self.db.stream(query)
+        async for row in result:
+            yield row
+
     async def deactivate_user(self, user: User) -> bool:
         user.is_active = False
         await self.db.flush()
         return True
 
-    async def update_user(self, user: User, **kwargs) -> User | None:
-        for key, value in kwargs.items():
-            if value is None:
-                continue
-            setattr(user, key, value)
-        await self.db.flush()
-        await self.db.refresh(user)
-        return user
+    async def update_user(self, user_id: int, **kwargs) -> User | None:
+        values = {key: value for key, value in kwargs.items() if value is not None}
+        if not values:
+            return await self.get_user(user_id)
+        return await self.db.scalar(update(User).where(User.id == user_id).values(**values).returning(User))
@@ -1,10 +1,27 @@
 import logging
+from typing import Annotated
 
-from fastapi import APIRouter, Request, Response
+from fastapi import APIRouter, Depends, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy import select
 
-from src.auth.dependencies import TokenServiceDep, UserServiceDep, DatabaseDep
-from src.auth.schemas import SelfUserSchema, UserCreateSchema, UserLoginSchema, UserUpdateSchema, UserResponseSchema
+from src.auth.dependencies import AuthDep, TokenServiceDep, UserServiceDep, DatabaseDep, get_admin_user
+from src.auth.schemas import (
+    SelfUserSchema,
+    SessionSchema,
+    UserBatchRequestSchema,
+    UserBatchResponseSchema,
+    UserCreateSchema,
+    UserImportQuerySchema,
+    UserImportReportSchema,
+    UserListQuerySchema,
+    UserLoginSchema,
+    UserPageSchema,
+    UserUpdateSchema,
+    UserResponseSchema,
+)
+from src.config.db import replica_monitor
+from src.config.keys import key_ring
 
 log = logging.getLogger(__name__)
 
@@ -15,21 +32,67 @@ token_router = APIRouter()
 
 @general_router.get('/check/')
 async def health_check(db: DatabaseDep) -> Response:
+    # a lagging replica does not fail the check, reads fall back to the primary
+    await replica_monitor.check()
     if await db.scalar(select(1)):
         log.debug('Health check passed')
         return Response('success')
     return Response('fail', 503)
 
 
+@general_router.get('/.well-known/jwks.json')
+async def get_jwks(request: Request) -> Response:
+    if key_ring is None:
+        return JSONResponse({'keys': []})
+
+    body, etag = key_ring.jwks()
+    headers = {'ETag': etag, 'Cache-Control': f'public, max-age={key_ring.jwks_ttl}'}
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type='application/json', headers=headers)
+
+
 # User router section
+@user_router.get('/', response_model=UserPageSchema, dependencies=[Depends(get_admin_user)])
+async def list_users(query: Annotated[UserListQuerySchema, Query()], service: UserServiceDep):
+    if query.format == 'ndjson':
+        return StreamingResponse(service.export_users(query), media_type='application/x-ndjson')
+    return await service.list_users(query)
+
+
 @user_router.get('/me/', response_model=SelfUserSchema)
-async def get_self_user(request: Request, service: UserServiceDep):
-    return await service.get_or_404(request.auth.id)
+async def get_self_user(auth: AuthDep, service: UserServiceDep):
+    return await service.get_self_user_response(auth.id)
+
+
+@user_router.get('/me/sessions/', response_model=list[SessionSchema])
+async def list_sessions(auth: AuthDep, service: UserServiceDep):
+    return await service.list_sessions(auth.id)
+
+
+@user_router.delete('/me/sessions/', status_code=204)
+async def revoke_sessions(auth: AuthDep, service: UserServiceDep) -> None:
+    await service.revoke_sessions(auth.id)
+
+
+@user_router.delete('/me/sessions/{session_id}/', status_code=204)
+async def revoke_session(session_id: str, auth: AuthDep, service: UserServiceDep) -> None:
+    await service.revoke_session(auth.id, session_id)
+
+
+@user_router.post('/batch/', response_model=UserBatchResponseSchema)
+async def get_users_batch(batch: UserBatchRequestSchema, service: UserServiceDep):
+    return await service.get_users_batch(batch.ids)
+
+
+@user_router.post('/import/', response_model=UserImportReportSchema, dependencies=[Depends(get_admin_user)])
+async def import_users(request: Request, query: Annotated[UserImportQuerySchema, Query()], service: UserServiceDep):
+    return await service.import_users(request.stream(), query.format, query.skip)
 
 
 @user_router.get('/{user_id}/', response_model=UserResponseSchema)
 async def get_user_by_id(user_id: int, service: UserServiceDep):
-    return await service.get_or_404(user_id)
+    return await service.get_user_response(user_id)
 
 
 @user_router.post('/', response_model=UserResponseSchema, status_code=201)
@@ -49,8 +112,8 @@ async def deactivate_user(user_id: int, service: UserServiceDep) -> bool:
 
 # Token router section
 @token_router.post('/create/', status_code=204)
-async def create_token(credentials: UserLoginSchema, token_service: TokenServiceDep):
-    return await token_service.create_token(credentials)
+async def create_token(credentials: UserLoginSchema, request: Request, token_service: TokenServiceDep):
+    return await token_service.create_token(credentials, request.client.host if request.client else None)
 
 
 @token_router.post('/refresh/', status_code=204)
@@ -1,20 +1,32 @@
 import re
-from datetime import timedelta
-from typing import Optional
+from datetime import datetime, timedelta
+from typing import Literal, Optional
 
 from pydantic import BaseModel, ConfigDict, Field, model_validator
 
 from src.auth.models import Role
 
+USER_BATCH_MAX_SIZE = 100
+USER_PAGE_MAX_SIZE = 500
+EMAIL_PATTERN = re.compile(r'[^@]+@[^@]{2,10}\.[^@]{1,4}$')
+
 
 class JwtTokenSchema(BaseModel):
     access: str
     refresh: Optional[str]
 
     jti: str
+    refresh_jti: Optional[str] = None
+    family: Optional[str] = None
     model_config = ConfigDict(extra='ignore')
 
 
+class SessionSchema(BaseModel):
+    id: str
+    created_at: Optional[datetime]
+    expires_at: datetime
+
+
 class BaseOrmSchema(BaseModel):
     model_config = ConfigDict(extra='ignore', from_attributes=True)
 
@@ -54,7 +66,7 @@ class UserUpdateSchema(BaseOrmSchema):
     def validate_email(self) -> 'UserUpdateSchema':
         if self.email is None:
             return self
-        if not re.search(r'[^@]+@[^@]{2,10}\.[^@]{1,4}$', self.email):
+        if not EMAIL_PATTERN.search(self.email):
             raise ValueError('Invalid email')
         return self
 
@@ -67,10 +79,80 @@ class UserUpdateSchema(BaseOrmSchema):
         return self
 
 class SelfUserSchema(BaseUserSchema):
-    email: str
+    email: Optional[str]
     role: Role
     groups: list[BaseGroupSchema]
 
 class UserResponseSchema(BaseUserSchema):
     id: int
-    email: Optional[str]
\ No newline at end of file
+    email: Optional[str]
+
+
+class UserBatchRequestSchema(BaseModel):
+    ids: list[int] = Field(
+        min_length=1,
+        max_length=USER_BATCH_MAX_SIZE,
+        description=f'User ids to resolve, at most {USER_BATCH_MAX_SIZE} per request',
+    )
+
+
+class UserBatchItemSchema(UserResponseSchema):
+    groups: list[BaseGroupSchema]
+
+
+class UserBatchResponseSchema(BaseModel):
+    users: list[UserBatchItemSchema]
+    missing: list[int]
+
+
+class UserListQuerySchema(BaseModel):
+    after: Optional[int] = Field(default=None, description='Return users with id greater than this cursor')
+    limit: int = Field(default=50, ge=1, le=USER_PAGE_MAX_SIZE)
+    role: Optional[Role] = None
+    is_active: Optional[bool] = None
+    group: Optional[str] = Field(default=None, description='Group name')
+    format: Literal['json', 'ndjson'] = Field(
+        default='json', description='`ndjson` streams every matching user after the cursor, ignoring `limit`'
+    )
+
+
+class UserListItemSchema(UserResponseSchema):
+    role: Role
+    is_active: bool
+
+
+class UserPageSchema(BaseModel):
+    items: list[UserListItemSchema]
+    next_cursor: Optional[int]
+
+
+class UserImportQuerySchema(BaseModel):
+    format: Literal['csv', 'ndjson'] = Field(
+        default='csv', description='CSV with a `username,password,email` header, or one JSON object per line'
+    )
+    skip: int = Field(default=0, ge=0, description='Rows already imported, `processed` of the failed import')
+
+
+class UserImportRowSchema(BaseUserSchema):
+    password: str = Field(min_length=8, max_length=50)
+    email: Optional[str] = Field(default=None, max_length=100)
+
+    @model_validator(mode='after')
+    def validate_row(self) -> 'UserImportRowSchema':
+        if self.password == self.username:
+            raise ValueError('Password cannot be same as username')
+        if self.email is not None and not EMAIL_PATTERN.search(self.email):
+            raise ValueError('Invalid email')
+        return self
+
+
+class UserImportErrorSchema(BaseModel):
+    row: int
+    username: Optional[str]
+    error: str
+
+
+class UserImportReportSchema(BaseModel):
+    created: int = 0
+    processed: int = Field(default=0, description='Rows committed so far, pass as `skip` to resume the import')
+    errors: list[UserImportErrorSchema] = Field(default_factory=list)
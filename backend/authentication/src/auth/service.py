@@ -1,45 +1,73 @@
 import logging
 from datetime import timedelta
+from functools import partial
+from uuid import uuid4
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable
 
 from fastapi import HTTPException, Response
 from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+from redis.exceptions import RedisError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.auth.blacklist import revocation_filter, token_blacklist
+from src.auth.cache import user_cache
+from src.auth.families import Rotation, refresh_families
+from src.auth.importer import ImportFormat, UserImporter, iter_lines
+from src.auth.logins import login_stats
 from src.auth.models import User
 from src.auth.repository import UserRepository
+from src.auth.throttle import login_throttle
 from src.auth.schemas import (
+    BaseOrmSchema,
     JwtTokenSchema,
+    SelfUserSchema,
     UserCreateSchema,
+    UserImportReportSchema,
+    UserListItemSchema,
+    UserListQuerySchema,
     UserLoginSchema,
+    UserResponseSchema,
     UserUpdateSchema,
 )
+from src.config.db import on_commit
 from src.config.env import settings
-from src.config.security import JwtToken, PasswordHasher
+from src.config.security import JwtToken, PasswordHasher, hashing_pool, token_cache
 
 log = logging.getLogger(__name__)
+# attacker-driven volume, sampled by default
+failed_login_log = logging.getLogger(f'{__name__}.failed_login')
 
 
 class UserService:
-    def __init__(self, db: AsyncSession) -> None:
+    def __init__(self, db: AsyncSession, redis: Redis) -> None:
         self.repo = UserRepository(db)
+        self.redis = redis
 
     async def get_user_by_credentials(self, credentials: UserLoginSchema) -> User:
         db_user = await self.repo.get_user_by_username(credentials.username)
         if not db_user:
-            log.warning(f'User not found with name: {credentials.username}')
-            raise HTTPException(404, 'User not found')
+            # same status and timing as a wrong password, so responses do not reveal which usernames exist
+            await PasswordHasher.imitate_verify()
+            failed_login_log.warning('User not found with name: %s', credentials.username)
+            raise HTTPException(401, 'Incorrect credentials')
 
-        is_correct = PasswordHasher.verify_password(credentials.password, db_user.password)
+        is_correct, new_hash = await PasswordHasher.verify_and_update(credentials.password, db_user.password)
         if not is_correct:
-            log.warning(f'Incorrect credentials for user: {credentials.username}')
+            failed_login_log.warning('Incorrect credentials for user: %s', credentials.username)
             raise HTTPException(401, 'Incorrect credentials')
 
+        if new_hash:
+            # the plain password is only available here, so hashes follow scheme and cost changes on login
+            db_user = await self.repo.update_user(db_user.id, password=new_hash)
+            log.info('Password rehashed with current settings for user: %s', credentials.username)
+
         return db_user
 
     async def get_or_404(self, user_id) -> User:
         db_user = await self.repo.get_user(user_id)
         if not db_user:
-            log.warning(f'User not found with id: {user_id}')
+            log.warning('User not found with id: %s', user_id)
             raise HTTPException(404, 'User not found')
         return db_user
 
@@ -49,36 +77,131 @@ class UserService:
     async def get_self_user(self, user_id) -> User:
         db_user = await self.repo.get_user_eager(user_id)
         if not db_user:
-            log.warning(f'User not found with id: {user_id}')
+            log.warning('User not found with id: %s', user_id)
             raise HTTPException(404, 'User not found')
         return db_user
 
+    async def get_user_response(self, user_id: int) -> dict:
+        return await self._get_cached_view(user_id, 'public', self.repo.get_user, UserResponseSchema)
+
+    async def get_self_user_response(self, user_id: int) -> dict:
+        return await self._get_cached_view(user_id, 'self', self.repo.get_user_eager, SelfUserSchema)
+
+    async def _get_cached_view(
+        self, user_id: int, view: str, getter: Callable[[int], Awaitable[User | None]], schema: type[BaseOrmSchema]
+    ) -> dict:
+        async def load() -> dict | None:
+            db_user = await getter(user_id)
+            return schema.model_validate(db_user).model_dump(mode='json') if db_user else None
+
+        cached_user = await user_cache.get(self.redis, user_id, view, load)
+        if cached_user is None:
+            log.warning('User not found with id: %s', user_id)
+            raise HTTPException(404, 'User not found')
+        return cached_user
+
+    async def _invalidate_cached_user(self, user_id: int) -> None:
+        try:
+            await user_cache.invalidate(self.redis, user_id)
+        except RedisError as redis_error:
+            log.error('redis error while invalidating user %s: %s', user_id, redis_error)
+
+    async def _invalidate_on_write(self, user_id: int) -> None:
+        # drop now for this request, and again after commit so a concurrent read cannot re-cache the old row
+        await self._invalidate_cached_user(user_id)
+        on_commit(self.repo.db, partial(self._invalidate_cached_user, user_id))
+
+    async def get_users_batch(self, user_ids: list[int]) -> dict:
+        user_ids = list(dict.fromkeys(user_ids))
+        db_users = {user.id: user for user in await self.repo.get_users(user_ids)}
+        return {
+            'users': [db_users[user_id] for user_id in user_ids if user_id in db_users],
+            'missing': [user_id for user_id in user_ids if user_id not in db_users],
+        }
+
+    async def list_users(self, query: UserListQuerySchema) -> dict:
+        filters = query.model_dump(include={'after', 'role', 'is_active', 'group'})
+        db_users = await self.repo.list_users(query.limit + 1, **filters)
+        has_more = len(db_users) > query.limit
+        db_users = db_users[: query.limit]
+        return {'items': db_users, 'next_cursor': db_users[-1].id if has_more else None}
+
+    async def export_users(self, query: UserListQuerySchema) -> AsyncIterator[bytes]:
+        filters = query.model_dump(include={'after', 'role', 'is_active', 'group'})
+        async for row in self.repo.stream_users(**filters):
+            yield UserListItemSchema.model_validate(row).model_dump_json().encode() + b'\n'
+
     async def create_user(self, user_data: UserCreateSchema) -> User:
-        password_hash = PasswordHasher.get_password_hash(user_data.password)
+        password_hash = await PasswordHasher.get_password_hash(user_data.password)
         user = await self.repo.create_user(user_data.username, password_hash)
-        log.info(f'User created with name: {user.username}')
+        log.info('User created with name: %s', user.username)
         return user
 
+    async def import_users(
+        self, chunks: AsyncIterable[bytes], format: ImportFormat, skip: int
+    ) -> UserImportReportSchema:
+        # the pool also verifies logins, an import only gets a share of it
+        max_hash_workers = max(1, int(hashing_pool.workers * settings.imports.HASHING_SHARE))
+        importer = UserImporter(
+            self.repo, hashing_pool, settings.imports.BATCH_SIZE, max_hash_workers=max_hash_workers
+        )
+        try:
+            report = await importer.run(iter_lines(chunks), format, skip)
+        except UnicodeDecodeError:
+            log.warning('User import stopped on invalid UTF-8 after row %s', importer.report.processed)
+            raise HTTPException(400, f'Invalid UTF-8 after row {importer.report.processed}, resume with that skip')
+        log.info('Imported %s users, %s rows rejected', report.created, len(report.errors))
+        return report
+
     async def update_user(self, user_id: int, update_fields: UserUpdateSchema) -> User:
-        db_user = await self.get_or_404(user_id)
-        db_user = await self.repo.update_user(db_user, **update_fields.model_dump(exclude_unset=True))
+        fields = update_fields.model_dump(exclude_unset=True)
+        if fields.get('password'):
+            fields['password'] = await PasswordHasher.get_password_hash(fields['password'])
+        db_user = await self.repo.update_user(user_id, **fields)
+        if not db_user:
+            log.warning('User not found with id: %s', user_id)
+            raise HTTPException(404, 'User not found')
+        await self._invalidate_on_write(user_id)
+        if fields.get('password'):
+            await self.revoke_sessions(user_id)
         return db_user
 
     async def deactivate_user(self, user_id: int) -> bool:
         db_user = await self.get_or_404(user_id)
         is_deactivated = await self.repo.deactivate_user(db_user)
+        await self._invalidate_on_write(user_id)
+        await self.revoke_sessions(user_id)
         return is_deactivated
 
+    async def list_sessions(self, user_id: int) -> list[dict]:
+        return await refresh_families.list_sessions(self.redis, user_id)
+
+    async def revoke_session(self, user_id: int, session_id: str) -> None:
+        if not await refresh_families.revoke_sessions(self.redis, user_id, session_id):
+            log.warning('Session %s not found for user: %s', session_id, user_id)
+            raise HTTPException(404, 'Session not found')
+
+    async def revoke_sessions(self, user_id: int) -> int:
+        # revoked before the commit, a failed write only costs the user a new login
+        return await refresh_families.revoke_sessions(self.redis, user_id)
+
 
 class TokenService:
     def __init__(self, redis: Redis, user_service: UserService) -> None:
         self.redis = redis
         self.user_service = user_service
 
-    async def create_token(self, credentials: UserLoginSchema):
+    async def create_token(self, credentials: UserLoginSchema, client_ip: str | None):
+        # rejected attempts never reach the password hashing pool
+        await login_throttle.check(self.redis, credentials.username, client_ip)
         db_user = await self.user_service.get_user_by_credentials(credentials)
-        token_schema = self._encode_token_data(db_user, True)
-        await self._set_redis_session(token_schema, db_user)
+        token_schema = self._encode_token_data(db_user, uuid4().hex)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            self._set_redis_session(pipe, token_schema, db_user)
+            refresh_families.start(pipe, token_schema.family, token_schema.refresh_jti, token_schema.jti)
+            login_throttle.reset(pipe, credentials.username)
+            await pipe.execute()
+        login_stats.record(db_user.id)
         response = self._generate_cookie_response(token_schema)
         return response
 
@@ -87,59 +210,90 @@ class TokenService:
         if not refresh_token:
             raise HTTPException(401, 'Invalid refresh token')
 
-        access_token = request.cookies.get('access')
-        if access_token:
-            await self._set_redis_blacklist(access_token, JwtToken.TokenType.ACCESS)
-
         decoded_refresh_token = JwtToken.decode_token(refresh_token, JwtToken.TokenType.REFRESH)
         db_user = await self.user_service.get_self_user(int(decoded_refresh_token.get('sub')))
-        token_schema = self._encode_token_data(db_user, False)
-        await self._set_redis_session(token_schema, db_user)
+        family = decoded_refresh_token.get('fam', decoded_refresh_token['jti'])
+        token_schema = self._encode_token_data(db_user, family)
+
+        access_token = request.cookies.get('access')
+
+        def queue_writes(pipe: Pipeline) -> None:
+            self._set_redis_blacklist(pipe, refresh_token, JwtToken.TokenType.REFRESH)
+            if access_token:
+                self._set_redis_blacklist(pipe, access_token, JwtToken.TokenType.ACCESS)
+            self._set_redis_session(pipe, token_schema, db_user)
+
+        # the new session is written optimistically, so a successful rotation stays a single round trip
+        status, holder_jti = await refresh_families.rotate(
+            self.redis,
+            family,
+            decoded_refresh_token['jti'],
+            token_schema.refresh_jti,
+            token_schema.jti,
+            queue_writes,
+            legacy='fam' not in decoded_refresh_token,
+        )
+        if status != Rotation.ROTATED:
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(f'session:{token_schema.jti}')
+                if holder_jti:
+                    # the legitimate holder's access token goes with the family
+                    pipe.delete(f'session:{holder_jti}')
+                await pipe.execute()
+            raise HTTPException(401, 'Invalid refresh token')
+
         response = self._generate_cookie_response(token_schema)
         return response
 
     async def delete_token(self, request):
         refresh_token = request.cookies.get('refresh')
         access_token = request.cookies.get('access')
-        if access_token:
-            await self._set_redis_blacklist(access_token, JwtToken.TokenType.ACCESS)
-
-        if refresh_token:
-            await self._set_redis_blacklist(refresh_token, JwtToken.TokenType.REFRESH)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            if access_token:
+                decoded_access_token = self._set_redis_blacklist(pipe, access_token, JwtToken.TokenType.ACCESS)
+                pipe.delete(f'session:{decoded_access_token["jti"]}')
+            if refresh_token:
+                decoded_refresh_token = JwtToken.decode_token(refresh_token, JwtToken.TokenType.REFRESH)
+                self._set_redis_blacklist(pipe, refresh_token, JwtToken.TokenType.REFRESH)
+                refresh_families.revoke(pipe, decoded_refresh_token.get('fam', decoded_refresh_token['jti']))
+            await pipe.execute()
 
         response = Response()
         response.delete_cookie('access')
         response.delete_cookie('refresh')
         return response
 
-    async def _set_redis_session(self, token_schema: JwtTokenSchema, db_user: User):
+    def _set_redis_session(self, pipe: Pipeline, token_schema: JwtTokenSchema, db_user: User):
+        refresh_families.index(pipe, db_user.id, token_schema.family)
         key = f'session:{token_schema.jti}'
-        await self.redis.hset(key, 'user_id', str(db_user.id))
-        await self.redis.hset(key, 'groups', ','.join([group.name for group in db_user.groups]))
-        await self.redis.hset(key, 'role', db_user.role.value)
-        await self.redis.expire(key, timedelta(minutes=settings.auth.ACCESS_TOKEN_EXPIRE_MIN))
+        pipe.hset(
+            key,
+            mapping={
+                'user_id': str(db_user.id),
+                'groups': ','.join([group.name for group in db_user.groups]),
+                'role': db_user.role.value,
+            },
+        )
+        pipe.expire(key, timedelta(minutes=settings.auth.ACCESS_TOKEN_EXPIRE_MIN))
 
-    async def _set_redis_blacklist(self, token, token_type: JwtToken.TokenType):
+    def _set_redis_blacklist(self, pipe: Pipeline, token, token_type: JwtToken.TokenType) -> dict:
         decoded_token = JwtToken.decode_token(token, token_type)
-        key = f'blacklist:{decoded_token["jti"]}'
-        await self.redis.set(key, str(True))
-        await self.redis.expire(
-            key, settings.auth.ACCESS_TOKEN_EXPIRE_MIN
-        ) if token_type == JwtToken.TokenType.ACCESS else await self.redis.expire(
-            key, settings.auth.REFRESH_TOKEN_EXPIRE_DAY
-        )
+        token_cache.invalidate(token)
+        token_blacklist.add(pipe, decoded_token['jti'], decoded_token['exp'])
+        if token_type == JwtToken.TokenType.ACCESS:
+            # reused refresh tokens are caught by their family, the filter only guards access tokens
+            revocation_filter.publish(pipe, decoded_token['jti'])
+        return decoded_token
 
-    def _encode_token_data(self, user: User, has_refresh: bool):
+    def _encode_token_data(self, user: User, family: str):
         token_data = {
             'username': user.username,
             'sub': str(user.id),
         }
         access_token, jti = JwtToken.create_token(token_data, JwtToken.TokenType.ACCESS)
-        refresh_token = None
-        if has_refresh:
-            refresh_token, _ = JwtToken.create_token(token_data, JwtToken.TokenType.REFRESH)
+        refresh_token, refresh_jti = JwtToken.create_token({**token_data, 'fam': family}, JwtToken.TokenType.REFRESH)
 
-        return JwtTokenSchema(access=access_token, refresh=refresh_token, jti=jti)
+        return JwtTokenSchema(access=access_token, refresh=refresh_token, jti=jti, refresh_jti=refresh_jti, family=family)
 
     def _generate_cookie_response(self, token_schema: JwtTokenSchema):
         response = Response(status_code=204)
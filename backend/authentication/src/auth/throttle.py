@@ -0,0 +1,121 @@
+import logging
+import math
+from uuid import uuid4
+
+from fastapi import HTTPException
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+from redis.commands.core import AsyncScript
+from redis.exceptions import RedisError
+
+from src.config.env import settings
+from src.metrics import registry
+
+log = logging.getLogger(__name__)
+
+login_throttled = registry.counter('auth_login_throttled_total', 'Login attempts rejected before password verification')
+
+# KEYS: attempts sorted set, lockout key and strike counter, one triple per throttled dimension
+# ARGV: window ms, base lockout ms, max lockout ms, strikes ttl ms, attempt member, then one limit per dimension
+# returns 0 when the attempt is allowed, otherwise the remaining lockout in ms
+ATTEMPT_SCRIPT = b"""
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local window = tonumber(ARGV[1])
+local dimensions = #KEYS / 3
+
+for i = 0, dimensions - 1 do
+    local locked = redis.call('PTTL', KEYS[i * 3 + 2])
+    if locked > 0 then
+        return locked
+    end
+end
+
+for i = 0, dimensions - 1 do
+    local attempts = KEYS[i * 3 + 1]
+    redis.call('ZREMRANGEBYSCORE', attempts, '-inf', now - window)
+    if redis.call('ZCARD', attempts) >= tonumber(ARGV[6 + i]) then
+        local strikes = redis.call('INCR', KEYS[i * 3 + 3])
+        redis.call('PEXPIRE', KEYS[i * 3 + 3], ARGV[4])
+        local lockout = math.floor(math.min(tonumber(ARGV[2]) * 2 ^ (strikes - 1), tonumber(ARGV[3])))
+        redis.call('SET', KEYS[i * 3 + 2], strikes, 'PX', lockout)
+        return lockout
+    end
+end
+
+for i = 0, dimensions - 1 do
+    redis.call('ZADD', KEYS[i * 3 + 1], now, ARGV[5])
+    redis.call('PEXPIRE', KEYS[i * 3 + 1], window)
+end
+return 0
+"""
+
+
+class LoginThrottle:
+    """Sliding-window limit of login attempts per username and per client IP, checked before the password.
+
+    Going over a limit locks that username or IP out, each lockout within `strikes_ttl` doubles the previous one up to
+    `max_lockout`. A successful login clears the username window, the IP window is left alone as IPs can be shared.
+    """
+
+    def __init__(
+        self,
+        window_sec: int,
+        user_limit: int,
+        ip_limit: int,
+        base_lockout_sec: int,
+        max_lockout_sec: int,
+        strikes_ttl_sec: int,
+    ) -> None:
+        self.window_ms = window_sec * 1000
+        self.user_limit = user_limit
+        self.ip_limit = ip_limit
+        self.base_lockout_ms = base_lockout_sec * 1000
+        self.max_lockout_ms = max_lockout_sec * 1000
+        self.strikes_ttl_ms = strikes_ttl_sec * 1000
+        # bytes, so no client is needed to compute the sha, every call passes its own
+        self._script = AsyncScript(None, ATTEMPT_SCRIPT)
+
+    @staticmethod
+    def _keys(kind: str, value: str) -> list[str]:
+        key = f'throttle:{kind}:{value}'
+        return [key, f'{key}:lock', f'{key}:strikes']
+
+    async def check(self, redis: Redis, username: str, ip: str | None) -> None:
+        keys = self._keys('user', username)
+        limits = [self.user_limit]
+        if ip is not None:
+            keys += self._keys('ip', ip)
+            limits.append(self.ip_limit)
+
+        try:
+            retry_after_ms = await self._script(
+                keys,
+                [self.window_ms, self.base_lockout_ms, self.max_lockout_ms, self.strikes_ttl_ms, uuid4().hex, *limits],
+                client=redis,
+            )
+        except RedisError as redis_error:
+            # fail open, logins keep working without Redis-backed throttling
+            log.error('redis error while throttling login: %s', redis_error)
+            return
+
+        if retry_after_ms:
+            login_throttled.inc()
+            log.warning('Login throttled for user: %s, ip: %s', username, ip)
+            raise HTTPException(
+                429, 'Too many login attempts', headers={'Retry-After': str(math.ceil(retry_after_ms / 1000))}
+            )
+
+    def reset(self, pipe: Pipeline, username: str) -> None:
+        attempts, _, strikes = self._keys('user', username)
+        pipe.delete(attempts, strikes)
+
+
+login_throttle = LoginThrottle(
+    settings.throttle.WINDOW_SEC,
+    settings.throttle.USER_MAX_ATTEMPTS,
+    settings.throttle.IP_MAX_ATTEMPTS,
+    settings.throttle.LOCKOUT_BASE_SEC,
+    settings.throttle.LOCKOUT_MAX_SEC,
+    settings.throttle.STRIKES_TTL_SEC,
+)
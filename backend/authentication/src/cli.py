@@ -0,0 +1,84 @@
+import argparse
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import AsyncIterator
+
+from src.auth.importer import UserImporter
+from src.auth.repository import UserRepository
+from src.config.db import async_session, engine
+from src.config.env import settings
+from src.config.security import HashingPool, configure_password_hashing
+from src.logger import setup_logging
+
+log = logging.getLogger(__name__)
+
+
+async def read_lines(path: Path) -> AsyncIterator[str]:
+    with path.open(encoding='utf-8-sig', newline='') as file:
+        for line in file:
+            yield line.rstrip('\r\n')
+
+
+def read_checkpoint(path: Path) -> int:
+    try:
+        return int(path.read_text())
+    except FileNotFoundError:
+        return 0
+
+
+def write_checkpoint(path: Path, processed: int) -> None:
+    tmp_path = path.with_name(f'.{path.name}.tmp')
+    tmp_path.write_text(str(processed))
+    os.replace(tmp_path, path)
+
+
+async def import_users(args: argparse.Namespace) -> int:
+    format = args.format or ('ndjson' if args.file.suffix in ('.ndjson', '.jsonl') else 'csv')
+    checkpoint = args.checkpoint or args.file.with_name(f'{args.file.name}.checkpoint')
+    skip = read_checkpoint(checkpoint)
+    if skip:
+        log.info('Resuming import of %s after row %s', args.file, skip)
+
+    async def on_checkpoint(processed: int) -> None:
+        write_checkpoint(checkpoint, processed)
+
+    # the CLI owns the machine, so hashing always fans out to worker processes
+    pool = HashingPool('process', args.workers, max_queue=0)
+    configure_password_hashing(pool)
+    try:
+        async with async_session() as session:
+            importer = UserImporter(UserRepository(session), pool, args.batch_size, on_checkpoint)
+            report = await importer.run(read_lines(args.file), format, skip)
+    finally:
+        pool.shutdown()
+        await engine.dispose()
+
+    for error in report.errors:
+        print(f'row {error.row} ({error.username}): {error.error}')
+    print(f'created {report.created}, rejected {len(report.errors)}, processed {report.processed} rows')
+    checkpoint.unlink(missing_ok=True)
+    return 1 if report.errors else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog='python -m src.cli')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = commands.add_parser('import-users', help='Create users from a CSV or NDJSON file')
+    import_parser.add_argument('file', type=Path)
+    import_parser.add_argument('--format', choices=['csv', 'ndjson'], help='Defaults to the file extension')
+    import_parser.add_argument('--batch-size', type=int, default=settings.imports.BATCH_SIZE)
+    import_parser.add_argument('--workers', type=int, default=settings.hashing.WORKERS)
+    import_parser.add_argument(
+        '--checkpoint', type=Path, help='Progress file of an interrupted import, defaults to <file>.checkpoint'
+    )
+
+    args = parser.parse_args()
+    setup_logging()
+    return asyncio.run(import_users(args))
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,27 +1,246 @@
+import asyncio
 import logging
+import math
+import time
+from typing import Awaitable, Callable
 
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
-from sqlalchemy.orm import DeclarativeBase
+from fastapi import Request
+from sqlalchemy import event, exc, text
+from sqlalchemy.engine import ExceptionContext
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import DeclarativeBase, ORMExecuteState, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.sql.dml import UpdateBase
 from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
 
+from src.metrics import registry
 from .env import settings
 
 log = logging.getLogger(__name__)
 
-engine = create_async_engine(settings.db.DATABASE_URL)
+pool_checkout_wait = registry.histogram('db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled connection')
+pool_timeouts = registry.counter('db_pool_timeouts_total', 'Checkouts that gave up because the pool was exhausted')
+pool_checked_out = registry.gauge('db_pool_checked_out', 'Connections currently checked out of the pool')
+pool_overflow = registry.gauge('db_pool_overflow', 'Connections open beyond pool_size')
+replica_lag = registry.gauge('db_replica_lag_seconds', 'Replication lag of the read replica at the last check')
+replica_reads = registry.counter('db_replica_reads_total', 'Statements routed to the read replica')
+statement_duration = registry.histogram(
+    'db_statement_duration_seconds', 'SQL statement execution time by statement kind', labelnames=('statement',)
+)
+redis_command_duration = registry.histogram(
+    'redis_command_duration_seconds', 'Redis round trip by command, a pipeline counts as one', labelnames=('command',)
+)
+
+STATEMENT_KINDS = {kind: statement_duration.labels(kind) for kind in ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'OTHER')}
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            pool_timeouts.inc()
+            raise
+        finally:
+            pool_checkout_wait.observe(time.perf_counter() - started)
+        self._report()
+        return connection
+
+    def _do_return_conn(self, record) -> None:
+        super()._do_return_conn(record)
+        self._report()
+
+    def _report(self) -> None:
+        pool_checked_out.set(self.checkedout())
+        pool_overflow.set(max(self.overflow(), 0))
+
+
+def _start_statement(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault('statement_started', []).append(time.perf_counter())
+
+
+def _finish_statement(conn, cursor, statement, parameters, context, executemany) -> None:
+    started = conn.info['statement_started'].pop()
+    kind = STATEMENT_KINDS.get(statement[:6].upper(), STATEMENT_KINDS['OTHER'])
+    kind.observe(time.perf_counter() - started)
+
+
+def _drop_statement(context: ExceptionContext) -> None:
+    if context.connection is not None and context.connection.info.get('statement_started'):
+        context.connection.info['statement_started'].pop()
+
+
+def instrument_engine(engine: AsyncEngine) -> AsyncEngine:
+    event.listen(engine.sync_engine, 'before_cursor_execute', _start_statement)
+    event.listen(engine.sync_engine, 'after_cursor_execute', _finish_statement)
+    event.listen(engine.sync_engine, 'handle_error', _drop_statement)
+    return engine
+
+
+def create_engine(url: str, **kwargs) -> AsyncEngine:
+    engine = create_async_engine(
+        url,
+        poolclass=InstrumentedPool,
+        pool_size=settings.db.POOL_SIZE,
+        max_overflow=settings.db.MAX_OVERFLOW,
+        pool_timeout=settings.db.POOL_TIMEOUT_SEC,
+        pool_recycle=settings.db.POOL_RECYCLE_SEC,
+        pool_pre_ping=settings.db.POOL_PRE_PING,
+        connect_args={
+            'statement_cache_size': settings.db.STATEMENT_CACHE_SIZE,
+            'prepared_statement_cache_size': settings.db.PREPARED_STATEMENT_CACHE_SIZE,
+        },
+        **kwargs,
+    )
+    return instrument_engine(engine)
+
+
+async def warm_up_engine(engine: AsyncEngine, size: int) -> int:
+    """Opens up to `size` pooled connections at once and returns them to the pool, returns how many were opened"""
+    if isinstance(engine.pool, QueuePool):
+        # connections past pool_size would be closed again on return
+        size = min(size, engine.pool.size())
+    results = await asyncio.gather(*(engine.connect().start() for _ in range(size)), return_exceptions=True)
+    await asyncio.gather(*(result.close() for result in results if not isinstance(result, BaseException)))
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return size
+
+
+class ReplicaMonitor:
+    """Tracks the replication lag of the read replica.
+
+    Reads go to the replica only while the last check is fresh and within `max_lag`, otherwise to the primary.
+    """
+
+    # an idle primary does not advance the replay timestamp, so a fully replayed replica counts as no lag
+    lag_query = text(
+        'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+        'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END'
+    )
+
+    def __init__(self, engine: AsyncEngine | None, max_lag: float, check_interval: float) -> None:
+        self.engine = engine
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.lag: float | None = None
+        self.checked_at = -math.inf
+
+    @property
+    def available(self) -> bool:
+        return (
+            self.engine is not None
+            and self.lag is not None
+            and self.lag <= self.max_lag
+            # missed checks mean the replica state is unknown
+            and time.monotonic() - self.checked_at < 3 * self.check_interval
+        )
+
+    async def check(self) -> float | None:
+        if self.engine is None or time.monotonic() - self.checked_at < self.check_interval:
+            return self.lag
+        try:
+            async with self.engine.connect() as connection:
+                self.lag = float(await connection.scalar(self.lag_query) or 0)
+            replica_lag.set(self.lag)
+            if self.lag > self.max_lag:
+                log.warning('Replica lags %.1fs behind the primary, reading from the primary', self.lag)
+        except (exc.SQLAlchemyError, OSError) as replica_error:
+            log.error('Replica check failed, reading from the primary: %s', replica_error)
+            self.lag = None
+        self.checked_at = time.monotonic()
+        return self.lag
+
+    async def run(self) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(self.check_interval)
+
+
+class RoutingSession(Session):
+    """Sends reads to the replica while it is available, writes and every statement after a write to the primary"""
+
+    def __init__(self, *args, replica: ReplicaMonitor | None = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.replica = replica
+
+    def get_bind(self, mapper=None, *, clause=None, **kwargs):
+        if (
+            self.replica is None
+            or not self.replica.available
+            or self.info.get('pinned_to_primary')
+            or self._flushing
+            or isinstance(clause, UpdateBase)
+        ):
+            return super().get_bind(mapper, clause=clause, **kwargs)
+        replica_reads.inc()
+        return self.replica.engine.sync_engine
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _pin_on_write(orm_execute_state: ORMExecuteState) -> None:
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info['pinned_to_primary'] = True
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _pin_on_flush(session: Session, flush_context) -> None:
+    session.info['pinned_to_primary'] = True
+
+
+engine = create_engine(settings.db.DATABASE_URL)
+replica_engine = (
+    None
+    if settings.db.REPLICA_DATABASE_URL is None
+    # replica reads never need a transaction
+    else create_engine(settings.db.REPLICA_DATABASE_URL, isolation_level='AUTOCOMMIT')
+)
+replica_monitor = ReplicaMonitor(
+    replica_engine, settings.db.REPLICA_MAX_LAG_SEC, settings.db.REPLICA_CHECK_INTERVAL_SEC
+)
 async_session = async_sessionmaker(
     bind=engine,
     class_=AsyncSession,
+    sync_session_class=RoutingSession,
+    replica=replica_monitor,
     expire_on_commit=False,
     autoflush=False,
     autocommit=False,
 )
+# shares the pool, the asyncpg adapter switches a connection to autocommit without a round trip
+read_only_session = async_sessionmaker(
+    bind=engine.execution_options(isolation_level='AUTOCOMMIT'),
+    class_=AsyncSession,
+    sync_session_class=RoutingSession,
+    replica=replica_monitor,
+    expire_on_commit=False,
+    autoflush=False,
+    autocommit=False,
+)
+READ_ONLY_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+
+def on_commit(session: AsyncSession, callback: Callable[[], Awaitable]) -> None:
+    session.info.setdefault('after_commit', []).append(callback)
+
+
+async def get_session(request: Request):
+    # a session holds no connection until its first query, so Redis-only routes never touch the pool
+    if request.method in READ_ONLY_METHODS:
+        # reads run in autocommit, no BEGIN/COMMIT round trips and nothing to commit
+        async with read_only_session() as session:
+            yield session
+        return
 
-async def get_session():
     async with async_session() as session:
         try:
             yield session
-            await session.commit()
+            if session.in_transaction():
+                await session.commit()
+            for callback in session.info.pop('after_commit', []):
+                await callback()
         except Exception as session_error:
             # log.error(f'Error with database session occurred: {session_error}')
             try:
@@ -43,10 +262,50 @@ class Base(DeclarativeBase):
     pass
 
 
-redis = Redis(host=settings.redis.HOST, port=settings.redis.PORT, db=settings.redis.DB, decode_responses=True)
+class InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            redis_command_duration.labels('MULTI' if self.is_transaction else 'PIPELINE').observe(
+                time.perf_counter() - started
+            )
+
+
+class InstrumentedRedis(Redis):
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            redis_command_duration.labels(args[0]).observe(time.perf_counter() - started)
+
+    def pipeline(self, transaction: bool = True, shard_hint: str | None = None) -> Pipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+redis = InstrumentedRedis(
+    host=settings.redis.HOST, port=settings.redis.PORT, db=settings.redis.DB, decode_responses=True
+)
+
+
+async def warm_up_redis(client: Redis, size: int) -> int:
+    """Connects `size` pooled connections and returns them to the pool"""
+    pool = client.connection_pool
+    connections = []
+    try:
+        for _ in range(size):
+            connections.append(await pool.get_connection())
+    finally:
+        for connection in connections:
+            await pool.release(connection)
+    return len(connections)
+
+
 async def get_redis():
     try:
         yield redis
     except Exception as redis_error:
-        log.error(f'redis error: {redis_error}')
+        log.error('redis error: %s', redis_error)
         raise
\ No newline at end of file
@@ -1,15 +1,35 @@
 import logging
+import os
+from typing import Literal, Optional
 
-from pydantic import Field, PositiveInt
+from pydantic import Field, NonNegativeInt, PositiveFloat, PositiveInt, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 class AuthSettings(BaseSettings):
-    SECRET_KEY: str = Field(min_length=32)
+    SECRET_KEY: Optional[str] = Field(default=None, min_length=32)
     ACCESS_TOKEN_EXPIRE_MIN: PositiveInt = Field(default=15)
     REFRESH_TOKEN_EXPIRE_DAY: PositiveInt = Field(default=7)
-    ALGORITHM: str = Field(default='SHA256')
+    ALGORITHM: Literal[
+        'HS256', 'HS384', 'HS512', 'RS256', 'RS384', 'RS512', 'PS256', 'ES256', 'ES384', 'ES512', 'EdDSA'
+    ] = Field(default='RS256')
+    # shared by every replica, tokens signed by one are verified by all, see the auth_keys volume in compose.yml
+    KEYS_DIR: str = Field(default='keys')
+    # off in production, a missing volume then stops startup instead of leaving each replica with keys of its own
+    KEYS_DIR_CREATE: bool = Field(default=True)
+    KEY_ROTATION_DAYS: PositiveInt = Field(default=30)
     JWT_ISSUER: str = Field(default='user_service')
+    TOKEN_CACHE_SIZE: NonNegativeInt = Field(default=10_000)
+
+    @property
+    def is_symmetric(self) -> bool:
+        return self.ALGORITHM.startswith('HS')
+
+    @model_validator(mode='after')
+    def validate_secret_key(self) -> 'AuthSettings':
+        if self.is_symmetric and not self.SECRET_KEY:
+            raise ValueError(f'SECRET_KEY is required for {self.ALGORITHM}')
+        return self
 
 
 class DatabaseSettings(BaseSettings):
@@ -19,17 +39,46 @@ class DatabaseSettings(BaseSettings):
     PASS: str = Field(default='postgres')
     NAME: str = Field(default='auth')
 
+    POOL_SIZE: PositiveInt = Field(default=10)
+    MAX_OVERFLOW: NonNegativeInt = Field(default=10)
+    POOL_TIMEOUT_SEC: PositiveFloat = Field(default=5)
+    POOL_RECYCLE_SEC: int = Field(default=1800, ge=-1)
+    # a round trip on every checkout, POOL_RECYCLE_SEC already retires connections before server-side timeouts
+    POOL_PRE_PING: bool = Field(default=False)
+    # connections opened on startup, capped at POOL_SIZE, so the first requests skip the handshake
+    POOL_MIN_SIZE: NonNegativeInt = Field(default=5)
+    # asyncpg server-side statement cache, set both to 0 behind pgbouncer in transaction mode
+    STATEMENT_CACHE_SIZE: NonNegativeInt = Field(default=100)
+    PREPARED_STATEMENT_CACHE_SIZE: NonNegativeInt = Field(default=100)
+
+    # streaming replica for read-only queries, same credentials and database name as the primary
+    REPLICA_HOST: Optional[str] = Field(default=None)
+    REPLICA_PORT: int = Field(default=5432)
+    REPLICA_MAX_LAG_SEC: PositiveFloat = Field(default=2)
+    REPLICA_CHECK_INTERVAL_SEC: PositiveFloat = Field(default=5)
+
     @property
     def DATABASE_URL(self):
         return f'postgresql+asyncpg://{self.USER}:{self.PASS}@{self.HOST}:{self.PORT}/{self.NAME}'
 
+    @property
+    def REPLICA_DATABASE_URL(self) -> Optional[str]:
+        if self.REPLICA_HOST is None:
+            return None
+        return f'postgresql+asyncpg://{self.USER}:{self.PASS}@{self.REPLICA_HOST}:{self.REPLICA_PORT}/{self.NAME}'
+
     @property
     def SYNC_DATABASE_URL(self):
         return f'postgresql+psycopg2://{self.USER}:{self.PASS}@{self.HOST}:{self.PORT}/{self.NAME}'
 
 
 class Logging(BaseSettings):
-    LEVEL: str = Field(default='DEBUG')
+    LEVEL: str = Field(default='INFO')
+    FORMAT: Literal['text', 'json'] = Field(default='text')
+    # hand records to a background thread instead of writing them on the event loop
+    QUEUE: bool = Field(default=True)
+    # share of records up to WARNING kept per logger, children included
+    SAMPLING: dict[str, float] = Field(default={'src.auth.service.failed_login': 0.1})
 
     @property
     def LOGGING_NAME(self):
@@ -40,12 +89,84 @@ class RedisSettings(BaseSettings):
     HOST: str = Field(default='auth_redis')
     PORT: int = Field(default=6379)
     DB: int = Field(default=0)
+    # connections opened on startup, the pub/sub listener holds one more
+    POOL_MIN_SIZE: NonNegativeInt = Field(default=5)
+
+
+class HashingSettings(BaseSettings):
+    EXECUTOR: Literal['thread', 'process'] = Field(default='thread')
+    WORKERS: PositiveInt = Field(default_factory=lambda: os.cpu_count() or 1)
+    MAX_QUEUE: NonNegativeInt = Field(default=32)
+
+    # argon2id needs the `argon2` extra, existing bcrypt hashes are rehashed on login
+    SCHEME: Literal['bcrypt', 'argon2id'] = Field(default='bcrypt')
+    # bcrypt cost is calibrated on startup so a verify takes about this long, unless BCRYPT_ROUNDS pins it
+    TARGET_VERIFY_MS: PositiveInt = Field(default=250)
+    BCRYPT_ROUNDS: Optional[int] = Field(default=None, ge=4, le=31)
+    BCRYPT_MIN_ROUNDS: int = Field(default=10, ge=4, le=31)
+    ARGON2_MEMORY_KIB: PositiveInt = Field(default=19456)
+    ARGON2_TIME_COST: PositiveInt = Field(default=2)
+    ARGON2_PARALLELISM: PositiveInt = Field(default=1)
+
+
+class BlacklistSettings(BaseSettings):
+    FILTER_CAPACITY: PositiveInt = Field(default=100_000)
+    FILTER_ERROR_RATE: PositiveFloat = Field(default=0.001, lt=1)
+    FILTER_MAX_BYTES: PositiveInt = Field(default=1024 * 1024)
+    FILTER_SYNC_INTERVAL_MS: NonNegativeInt = Field(default=1000)
+    SIZE_INTERVAL_SEC: PositiveInt = Field(default=60)
+
+
+class CacheSettings(BaseSettings):
+    USER_LOCAL_SIZE: NonNegativeInt = Field(default=10_000)
+    USER_LOCAL_TTL_SEC: PositiveInt = Field(default=30)
+    USER_REDIS_TTL_SEC: PositiveInt = Field(default=300)
+    USER_LOCK_TTL_MS: PositiveInt = Field(default=2000)
+    # how long a user id that does not exist is remembered as missing
+    USER_MISS_TTL_MS: PositiveInt = Field(default=1000)
+
+
+class ThrottleSettings(BaseSettings):
+    WINDOW_SEC: PositiveInt = Field(default=900)
+    USER_MAX_ATTEMPTS: PositiveInt = Field(default=5)
+    # several users can share an address behind NAT
+    IP_MAX_ATTEMPTS: PositiveInt = Field(default=100)
+    LOCKOUT_BASE_SEC: PositiveInt = Field(default=60)
+    LOCKOUT_MAX_SEC: PositiveInt = Field(default=3600)
+    STRIKES_TTL_SEC: PositiveInt = Field(default=86400)
+
+
+class ImportSettings(BaseSettings):
+    # rows per multi-row INSERT and per commit, 5 bound parameters per row keep it under the 32767 limit
+    BATCH_SIZE: PositiveInt = Field(default=1000, le=5000)
+    # share of the hashing workers an import through the API may occupy, the others stay free for logins
+    HASHING_SHARE: PositiveFloat = Field(default=0.5, le=1)
+
+
+class LoginStatsSettings(BaseSettings):
+    FLUSH_INTERVAL_SEC: PositiveFloat = Field(default=5)
+    # users with unflushed logins that trigger an early flush
+    MAX_PENDING: PositiveInt = Field(default=10_000)
+
+
+class LifespanSettings(BaseSettings):
+    WARM_UP_TIMEOUT_SEC: PositiveFloat = Field(default=10)
+    # in-flight requests get this long to finish on shutdown, keep it under the orchestrator's kill grace period
+    DRAIN_TIMEOUT_SEC: PositiveFloat = Field(default=20)
+
 
 class Settings(BaseSettings):
     auth: AuthSettings = Field(default_factory=AuthSettings)
     db: DatabaseSettings = Field(default_factory=DatabaseSettings)
     log: Logging = Field(default_factory=Logging)
     redis: RedisSettings = Field(default_factory=RedisSettings)
+    hashing: HashingSettings = Field(default_factory=HashingSettings)
+    blacklist: BlacklistSettings = Field(default_factory=BlacklistSettings)
+    cache: CacheSettings = Field(default_factory=CacheSettings)
+    imports: ImportSettings = Field(default_factory=ImportSettings)
+    throttle: ThrottleSettings = Field(default_factory=ThrottleSettings)
+    logins: LoginStatsSettings = Field(default_factory=LoginStatsSettings)
+    lifespan: LifespanSettings = Field(default_factory=LifespanSettings)
 
     model_config = SettingsConfigDict(env_file='.env', extra='ignore', env_nested_delimiter='__')
 
@@ -0,0 +1,209 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from uuid import uuid4
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+from .env import settings
+
+log = logging.getLogger(__name__)
+
+# kids are issued as uuid4 hex, a header with anything else cannot name a key on disk
+KID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+
+def generate_private_key(algorithm: str):
+    if algorithm.startswith(('RS', 'PS')):
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    if algorithm == 'ES256':
+        return ec.generate_private_key(ec.SECP256R1())
+    if algorithm == 'ES384':
+        return ec.generate_private_key(ec.SECP384R1())
+    if algorithm == 'ES512':
+        return ec.generate_private_key(ec.SECP521R1())
+    if algorithm == 'EdDSA':
+        return ed25519.Ed25519PrivateKey.generate()
+    raise ValueError(f'Unsupported signing algorithm: {algorithm}')
+
+
+@dataclass
+class SigningKey:
+    kid: str
+    private_key: object
+    created_at: float
+
+    @property
+    def public_key(self):
+        return self.private_key.public_key()
+
+
+class KeyRing:
+    """Asymmetric signing keys stored as `<kid>.pem` files, shared by all workers through `directory`.
+
+    The newest key signs, every key that can still have live tokens verifies. `maintain` generates a new key once the
+    active one is about to turn `rotation_seconds` old and drops keys older than rotation + `retention_seconds`, it
+    runs off the event loop every `check_interval`. Requests only read the directory again for a well-formed unknown
+    kid, at most once per `reload_interval`. Without `create_directory` a missing directory is an error rather than
+    an empty ring.
+    """
+
+    def __init__(
+        self,
+        algorithm: str,
+        directory: str,
+        rotation_seconds: int,
+        retention_seconds: int,
+        check_interval: float = 60,
+        reload_interval: float = 5,
+        create_directory: bool = True,
+    ) -> None:
+        self.algorithm = algorithm
+        self.directory = Path(directory)
+        self.rotation_seconds = rotation_seconds
+        self.retention_seconds = retention_seconds
+        self.check_interval = check_interval
+        self.reload_interval = reload_interval
+        self.create_directory = create_directory
+        self.keys: dict[str, SigningKey] = {}
+        self.jwks_ttl = 60
+        self._jwks: tuple[bytes, str] | None = None
+        self._jwks_built_at = 0.0
+        self._loaded_at: float | None = None
+
+    def load(self) -> None:
+        if self.create_directory:
+            self.directory.mkdir(mode=0o700, parents=True, exist_ok=True)
+        elif not self.directory.is_dir():
+            raise FileNotFoundError(f'Signing keys directory {self.directory} does not exist')
+        keys = {}
+        for path in self.directory.glob('*.pem'):
+            # keys are never rewritten in place, only new files need parsing
+            key = self.keys.get(path.stem)
+            if key is None:
+                private_key = serialization.load_pem_private_key(path.read_bytes(), password=None)
+                key = SigningKey(path.stem, private_key, path.stat().st_mtime)
+            keys[path.stem] = key
+        # replaced, never mutated, as `maintain` runs in a thread while requests read the keys
+        self.keys = keys
+        self._jwks = None
+        self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded_at is None:
+            self.load()
+
+    def _reload_due(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.reload_interval
+
+    @property
+    def active(self) -> SigningKey | None:
+        return max(self.keys.values(), key=lambda key: key.created_at, default=None)
+
+    def rotate(self) -> SigningKey:
+        private_key = generate_private_key(self.algorithm)
+        kid = uuid4().hex
+        pem = private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+        tmp_path = self.directory / f'.{kid}.tmp'
+        tmp_path.write_bytes(pem)
+        os.chmod(tmp_path, 0o600)
+        tmp_path.rename(self.directory / f'{kid}.pem')
+
+        key = SigningKey(kid, private_key, time.time())
+        self.keys = {**self.keys, kid: key}
+        self._prune()
+        self._jwks = None
+        log.info('Rotated signing key, new kid: %s', kid)
+        return key
+
+    def _prune(self) -> None:
+        expired_before = time.time() - self.rotation_seconds - self.retention_seconds
+        active = self.active
+        expired = [kid for kid, key in self.keys.items() if key.created_at < expired_before and key is not active]
+        if expired:
+            self.keys = {kid: key for kid, key in self.keys.items() if kid not in expired}
+        for kid in expired:
+            (self.directory / f'{kid}.pem').unlink(missing_ok=True)
+
+    def _rotation_due(self, lead: float = 0) -> bool:
+        active = self.active
+        return active is None or time.time() - active.created_at >= self.rotation_seconds - lead
+
+    def signing_key(self) -> SigningKey:
+        self._ensure_loaded()
+        if self._rotation_due() and self._reload_due():
+            # another worker may already have rotated
+            self.load()
+        if self.active is None:
+            # only when nothing has run `maintain` yet, key generation otherwise stays off the request path
+            self.rotate()
+        return self.active
+
+    def verification_key(self, kid: str | None):
+        self._ensure_loaded()
+        key = self.keys.get(kid)
+        if key is None and kid is not None and KID_PATTERN.fullmatch(kid) and self._reload_due():
+            # the kid may have been rotated in by another worker, a flood of made-up kids costs one reload per interval
+            self.load()
+            key = self.keys.get(kid)
+        if key is None:
+            raise jwt.InvalidKeyError(f'Unknown key id: {kid}')
+        return key.public_key
+
+    def maintain(self) -> None:
+        """Picks up keys rotated by other workers and rotates one check early, so requests never generate a key"""
+        self.load()
+        if self._rotation_due(lead=self.check_interval):
+            self.rotate()
+        else:
+            self._prune()
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await asyncio.to_thread(self.maintain)
+            except OSError as key_error:
+                log.error('Failed to maintain signing keys: %s', key_error)
+
+    def jwks(self) -> tuple[bytes, str]:
+        # reload periodically to publish keys rotated by other workers
+        if self._jwks is None or time.monotonic() - self._jwks_built_at >= self.jwks_ttl:
+            self.load()
+            # publish a key even before the first token is signed
+            self.signing_key()
+            algorithm = jwt.get_algorithm_by_name(self.algorithm)
+            keys = []
+            for key in sorted(self.keys.values(), key=lambda key: key.created_at, reverse=True):
+                jwk = algorithm.to_jwk(key.public_key, as_dict=True)
+                jwk.update({'kid': key.kid, 'use': 'sig', 'alg': self.algorithm})
+                keys.append(jwk)
+            body = json.dumps({'keys': keys}, separators=(',', ':')).encode()
+            self._jwks = body, f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+            self._jwks_built_at = time.monotonic()
+        return self._jwks
+
+
+key_ring = (
+    None
+    if settings.auth.is_symmetric
+    else KeyRing(
+        settings.auth.ALGORITHM,
+        settings.auth.KEYS_DIR,
+        settings.auth.KEY_ROTATION_DAYS * 24 * 60 * 60,
+        settings.auth.REFRESH_TOKEN_EXPIRE_DAY * 24 * 60 * 60,
+        create_directory=settings.auth.KEYS_DIR_CREATE,
+    )
+)
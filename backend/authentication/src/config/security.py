@@ -1,26 +1,305 @@
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from enum import Enum
+import hashlib
 import logging
-from typing import Any
+import math
+import random
+import time
+from typing import Any, Callable
 from uuid import uuid4
 from fastapi import HTTPException
 from passlib.context import CryptContext
+from passlib.hash import argon2, bcrypt
+from src.metrics import registry
 from .env import settings
+from .keys import key_ring
 import jwt
 
 log = logging.getLogger(__name__)
 
 pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
 
+hash_queue_wait = registry.histogram('auth_hash_queue_wait_seconds', 'Time spent waiting for a hashing worker')
+hash_duration = registry.histogram('auth_hash_duration_seconds', 'Time spent hashing or verifying a password')
+hash_rejected = registry.counter('auth_hash_rejected_total', 'Hashing jobs rejected because the pool was saturated')
+token_cache_hits = registry.counter('auth_token_cache_hits_total', 'Token validations served from the local cache')
+token_cache_misses = registry.counter('auth_token_cache_misses_total', 'Token validations that required a full decode')
+token_cache_evictions = registry.counter('auth_token_cache_evictions_total', 'Token cache entries evicted by size limit')
+password_verify_duration = registry.histogram(
+    'auth_password_verify_seconds', 'Password verification as seen by the caller, queueing included'
+)
+jwt_duration = registry.histogram(
+    'auth_jwt_duration_seconds', 'Time spent signing or verifying a JWT', labelnames=('operation',)
+)
+jwt_encode_duration = jwt_duration.labels('encode')
+jwt_decode_duration = jwt_duration.labels('decode')
+
+
+def _verify(plain_password, hashed_password) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def _verify_and_update(plain_password, hashed_password) -> tuple[bool, str | None]:
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+def _hash(password) -> str:
+    return pwd_context.hash(password)
+
+
+def _configure_context(context_config: dict) -> None:
+    # also the initializer of process workers, they do not share the parent's context
+    pwd_context.load(context_config)
+
+
+def _map(func: Callable, items: list) -> list:
+    return [func(item) for item in items]
+
+
+def _timed(func: Callable, *args) -> tuple[Any, float, float]:
+    # time.monotonic is system-wide, so timestamps are comparable across worker processes
+    started = time.monotonic()
+    result = func(*args)
+    return result, started, time.monotonic()
+
+
+class HashingPool:
+    def __init__(self, executor: str, workers: int, max_queue: int) -> None:
+        self.executor_type = executor
+        self.workers = workers
+        self.max_queue = max_queue
+        self.pending = 0
+        self.context_config: dict | None = None
+        self._executor: Executor | None = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_type == 'process' and self.context_config is not None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, initializer=_configure_context, initargs=(self.context_config,)
+                )
+            elif self.executor_type == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def configure(self, context_config: dict) -> None:
+        _configure_context(context_config)
+        self.context_config = context_config
+        if self.executor_type == 'process':
+            # workers already running keep the old context
+            self.shutdown(wait=False)
+
+    @property
+    def saturated(self) -> bool:
+        return self.pending >= self.workers + self.max_queue
+
+    async def run(self, func: Callable, *args):
+        if self.saturated:
+            hash_rejected.inc()
+            log.warning('Hashing pool saturated with %s pending jobs', self.pending)
+            raise HTTPException(503, 'Service is busy, try again later', headers={'Retry-After': '1'})
+
+        self.pending += 1
+        submitted = time.monotonic()
+        try:
+            loop = asyncio.get_running_loop()
+            result, started, finished = await loop.run_in_executor(self.executor, _timed, func, *args)
+        finally:
+            self.pending -= 1
+
+        hash_queue_wait.observe(max(started - submitted, 0.0))
+        hash_duration.observe(finished - started)
+        return result
+
+    async def map(self, func: Callable, items: list, max_workers: int | None = None) -> list:
+        """Runs `func` over `items` on the pool, `max_workers` leaves the rest of a shared pool to other callers"""
+        if not items:
+            return []
+        if max_workers is not None:
+            # one item per job and at most `max_workers` of them submitted, so other jobs never queue behind a batch
+            semaphore = asyncio.Semaphore(min(max_workers, self.workers))
+
+            async def run_item(item):
+                async with semaphore:
+                    return await self.run(func, item)
+
+            return list(await asyncio.gather(*(run_item(item) for item in items)))
+
+        # one job per worker, process pools pay the pickling round trip per chunk instead of per item
+        chunk_size = math.ceil(len(items) / self.workers)
+        chunks = [items[i : i + chunk_size] for i in range(0, len(items), chunk_size)]
+        results = await asyncio.gather(*(self.run(_map, func, chunk) for chunk in chunks))
+        return [result for chunk in results for result in chunk]
+
+    def shutdown(self, wait: bool = True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+hashing_pool = HashingPool(settings.hashing.EXECUTOR, settings.hashing.WORKERS, settings.hashing.MAX_QUEUE)
+
+
+class LatencySampler:
+    """Ring buffer of recent latencies to draw random samples from"""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._samples: list[float] = []
+        self._next = 0
+
+    def observe(self, value: float) -> None:
+        if len(self._samples) < self.size:
+            self._samples.append(value)
+        else:
+            self._samples[self._next] = value
+        self._next = (self._next + 1) % self.size
+
+    def sample(self) -> float | None:
+        return random.choice(self._samples) if self._samples else None
+
+
+# end to end, queueing included, that is what a caller of verify_and_update observes
+verify_latency = LatencySampler(256)
+
+
+def calibrate_bcrypt_rounds(target_seconds: float, min_rounds: int, max_rounds: int = 20) -> int:
+    # every extra round doubles the cost, so a cheap measurement extrapolates
+    base_rounds = 8
+    handler = bcrypt.using(rounds=base_rounds)
+    password_hash = handler.hash('calibration')
+    timings = [_timed(handler.verify, 'calibration', password_hash) for _ in range(3)]
+    elapsed = min(finished - started for _, started, finished in timings)
+    rounds = base_rounds + round(math.log2(target_seconds / elapsed))
+    return max(min_rounds, min(rounds, max_rounds))
+
+
+def password_context_config(bcrypt_rounds: int) -> dict:
+    config = {
+        'schemes': ['bcrypt'],
+        'deprecated': 'auto',
+        'bcrypt__default_rounds': bcrypt_rounds,
+        # hashes outside the range are rehashed on login, one round of slack absorbs calibration noise between workers
+        'bcrypt__min_rounds': max(bcrypt_rounds - 1, 4),
+        'bcrypt__max_rounds': bcrypt_rounds + 1,
+    }
+    if settings.hashing.SCHEME == 'argon2id':
+        config.update(
+            {
+                # bcrypt stays verifiable and is deprecated, so it migrates to argon2id on login
+                'schemes': ['argon2', 'bcrypt'],
+                'argon2__type': 'ID',
+                'argon2__memory_cost': settings.hashing.ARGON2_MEMORY_KIB,
+                'argon2__parallelism': settings.hashing.ARGON2_PARALLELISM,
+                'argon2__default_rounds': settings.hashing.ARGON2_TIME_COST,
+                'argon2__min_rounds': settings.hashing.ARGON2_TIME_COST,
+                'argon2__max_rounds': settings.hashing.ARGON2_TIME_COST,
+            }
+        )
+    return config
+
+
+def configure_password_hashing(pool: HashingPool = hashing_pool) -> None:
+    if settings.hashing.SCHEME == 'argon2id' and not argon2.has_backend():
+        raise RuntimeError('argon2id hashing needs the argon2 extra: uv sync --extra argon2')
+    rounds = settings.hashing.BCRYPT_ROUNDS
+    if rounds is None:
+        rounds = calibrate_bcrypt_rounds(settings.hashing.TARGET_VERIFY_MS / 1000, settings.hashing.BCRYPT_MIN_ROUNDS)
+    pool.configure(password_context_config(rounds))
+    log.info('Password hashing configured with %s, bcrypt cost %s', settings.hashing.SCHEME, rounds)
+
 
 class PasswordHasher:
     @staticmethod
-    def verify_password(plain_password, hashed_password) -> bool:
-        return pwd_context.verify(plain_password, hashed_password)
+    async def verify_password(plain_password, hashed_password) -> bool:
+        with password_verify_duration.time():
+            return await hashing_pool.run(_verify, plain_password, hashed_password)
 
     @staticmethod
-    def get_password_hash(password) -> str:
-        return pwd_context.hash(password)
+    async def verify_and_update(plain_password, hashed_password) -> tuple[bool, str | None]:
+        """Also returns a new hash when the stored one does not match the current scheme or cost"""
+        started = time.monotonic()
+        result = await hashing_pool.run(_verify_and_update, plain_password, hashed_password)
+        elapsed = time.monotonic() - started
+        verify_latency.observe(elapsed)
+        password_verify_duration.observe(elapsed)
+        return result
+
+    @staticmethod
+    async def imitate_verify() -> None:
+        """Takes as long as a real verify would, without occupying a hashing worker"""
+        if hashing_pool.saturated:
+            hash_rejected.inc()
+            raise HTTPException(503, 'Service is busy, try again later', headers={'Retry-After': '1'})
+        latency = verify_latency.sample()
+        await asyncio.sleep(settings.hashing.TARGET_VERIFY_MS / 1000 if latency is None else latency)
+
+    @staticmethod
+    async def get_password_hash(password) -> str:
+        return await hashing_pool.run(_hash, password)
+
+    @staticmethod
+    async def get_password_hashes(
+        passwords: list[str], pool: HashingPool = hashing_pool, max_workers: int | None = None
+    ) -> list[str]:
+        return await pool.map(_hash, passwords, max_workers)
+
+
+class TokenCache:
+    """LRU of already verified token payloads, each entry lives until the token's own `exp`"""
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._entries: OrderedDict[bytes, tuple[float, dict]] = OrderedDict()
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> dict | None:
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            token_cache_misses.inc()
+            return None
+
+        expires_at, payload = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            token_cache_misses.inc()
+            return None
+
+        self._entries.move_to_end(key)
+        token_cache_hits.inc()
+        return dict(payload)
+
+    def set(self, token: str, payload: dict) -> None:
+        if not self.maxsize or 'exp' not in payload:
+            return
+        key = self._key(token)
+        self._entries[key] = (float(payload['exp']), dict(payload))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            token_cache_evictions.inc()
+
+    def invalidate(self, token: str) -> None:
+        self._entries.pop(self._key(token), None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+token_cache = TokenCache(settings.auth.TOKEN_CACHE_SIZE)
 
 
 class JwtToken:
@@ -47,31 +326,46 @@ class JwtToken:
         elif token_type == JwtToken.TokenType.REFRESH:
             data.update({'exp': now + timedelta(days=settings.auth.REFRESH_TOKEN_EXPIRE_DAY)})
         else:
-            log.error(f'Unhandled token type: {token_type}')
+            log.error('Unhandled token type: %s', token_type)
             raise HTTPException(403, 'Error while authorize')
         try:
-            return jwt.encode(data, settings.auth.SECRET_KEY, algorithm=settings.auth.ALGORITHM), jti
+            with jwt_encode_duration.time():
+                if key_ring is None:
+                    return jwt.encode(data, settings.auth.SECRET_KEY, algorithm=settings.auth.ALGORITHM), jti
+                signing_key = key_ring.signing_key()
+                return jwt.encode(
+                    data, signing_key.private_key, algorithm=settings.auth.ALGORITHM, headers={'kid': signing_key.kid}
+                ), jti
         except jwt.PyJWTError as e:
-            log.error(f'Error while encoding token: {e}')
+            log.error('Error while encoding token: %s', e)
             raise HTTPException(403, 'Incorrect token data')
 
     @staticmethod
     def decode_token(token, token_type: TokenType) -> dict:
-        try:
-            payload = jwt.decode(
-                token,
-                settings.auth.SECRET_KEY,
-                algorithms=[settings.auth.ALGORITHM],
-                # options=({'verify_exp': True, 'verify_aud': False})
-            )
-            if payload.get('type') != token_type.value:
-                raise HTTPException(403, 'Invalid token type')
-
-            return payload
-        except jwt.ExpiredSignatureError:
-            raise HTTPException(401, 'Token expired')
-        # except jwt.InvalidTokenError:
-        #     raise HTTPException(403, 'Invalid token')
-        except jwt.PyJWTError as e:
-            log.error(f'Error while decoding token: {e}')
-            raise HTTPException(403, 'Incorrect token')
+        payload = token_cache.get(token)
+        if payload is None:
+            try:
+                with jwt_decode_duration.time():
+                    if key_ring is None:
+                        key = settings.auth.SECRET_KEY
+                    else:
+                        key = key_ring.verification_key(jwt.get_unverified_header(token).get('kid'))
+                    payload = jwt.decode(
+                        token,
+                        key,
+                        algorithms=[settings.auth.ALGORITHM],
+                        # options=({'verify_exp': True, 'verify_aud': False})
+                    )
+            except jwt.ExpiredSignatureError:
+                raise HTTPException(401, 'Token expired')
+            # except jwt.InvalidTokenError:
+            #     raise HTTPException(403, 'Invalid token')
+            except jwt.PyJWTError as e:
+                log.error('Error while decoding token: %s', e)
+                raise HTTPException(403, 'Incorrect token')
+            token_cache.set(token, payload)
+
+        if payload.get('type') != token_type.value:
+            raise HTTPException(403, 'Invalid token type')
+
+        return payload
@@ -1,33 +1,128 @@
+import atexit
+import json
 import logging
+import queue
+import random
 import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
 
 from src.config import settings
 
+request_id: ContextVar[str] = ContextVar('request_id', default='-')
+
+_listener: QueueListener | None = None
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps records with the id of the request they were logged in, before they leave the request's context"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a share of the records up to WARNING from the configured loggers and their children"""
+
+    def __init__(self, rates: dict[str, float]) -> None:
+        super().__init__()
+        self.rates = rates
+
+    def _rate(self, name: str) -> float | None:
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition('.')[0]
+        return None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self._rate(record.name) if record.levelno <= logging.WARNING else None
+        if rate is None or rate >= 1:
+            return True
+        record.sample_rate = rate
+        return random.random() < rate
+
+
+class LazyQueueHandler(QueueHandler):
+    """Hands the record to the listener thread as it is, message formatting and I/O both happen there"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # the stock handler formats here to make records picklable, a thread queue does not need that
+        return record
+
+
+class ColoredFormatter(logging.Formatter):
+    COLORS = {
+        'DEBUG': '\033[94m',
+        'INFO': '\033[92m',
+        'WARNING': '\033[93m',
+        'ERROR': '\033[91m',
+        'CRITICAL': '\033[95m',
+    }
+    RESET = '\033[0m'
+
+    def format(self, record):
+        color = self.COLORS.get(record.levelname, self.RESET)
+        message = super().format(record)
+        return f'{color}{message}{self.RESET}'
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'request_id', '-') != '-':
+            entry['request_id'] = record.request_id
+        if hasattr(record, 'sample_rate'):
+            entry['sample_rate'] = record.sample_rate
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _text_formatter(stream) -> logging.Formatter:
+    fmt = '%(asctime)s - %(name)s - %(levelname)s - %(request_id)s - %(message)s'
+    return ColoredFormatter(fmt) if stream.isatty() else logging.Formatter(fmt)
+
+
+def stop_logging() -> None:
+    """Writes out queued records and stops the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
 
 def setup_logging():
+    global _listener
     logger = logging.getLogger()
+    stop_logging()
     if logging.getLogger().hasHandlers():
         logger.handlers.clear()
 
     logger.setLevel(settings.log.LOGGING_NAME)
 
-    class ColoredFormatter(logging.Formatter):
-        COLORS = {
-            'DEBUG': '\033[94m',
-            'INFO': '\033[92m',
-            'WARNING': '\033[93m',
-            'ERROR': '\033[91m',
-            'CRITICAL': '\033[95m',
-        }
-        RESET = '\033[0m'
-
-        def format(self, record):
-            color = self.COLORS.get(record.levelname, self.RESET)
-            message = super().format(record)
-            return f'{color}{message}{self.RESET}'
-
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(logging.DEBUG)
-    console_formatter = ColoredFormatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    console_handler.setFormatter(console_formatter)
-    logger.addHandler(console_handler)
+    stream = sys.stdout
+    console_handler = logging.StreamHandler(stream)
+    console_handler.setFormatter(JsonFormatter() if settings.log.FORMAT == 'json' else _text_formatter(stream))
+
+    if not settings.log.QUEUE:
+        handler = console_handler
+    else:
+        handler = LazyQueueHandler(queue.SimpleQueue())
+        _listener = QueueListener(handler.queue, console_handler)
+        _listener.start()
+
+    # filters run in the logging task, where the request context is still available
+    handler.addFilter(SamplingFilter(settings.log.SAMPLING))
+    handler.addFilter(RequestIdFilter())
+    logger.addHandler(handler)
+
+
+atexit.register(stop_logging)
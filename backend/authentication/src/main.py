@@ -1,14 +1,88 @@
+import asyncio
 import logging
+from contextlib import asynccontextmanager, suppress
 
-from fastapi import APIRouter, FastAPI
+from fastapi import APIRouter, FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from starlette.middleware.cors import CORSMiddleware
 
+from src.auth.blacklist import token_blacklist
+from src.auth.cache import user_cache
+from src.auth.logins import login_stats
+from src.config.db import engine, redis, replica_engine, replica_monitor, warm_up_engine, warm_up_redis
+from src.config.env import settings
+from src.config.keys import key_ring
+from src.config.security import configure_password_hashing, hashing_pool
 from src.logger import setup_logging
+from src.metrics import registry
+from src.middleware import (
+    AuthenticationMiddleware,
+    DrainMiddleware,
+    MetricsMiddleware,
+    RequestIdMiddleware,
+    request_drain,
+)
 from src.auth.routes import user_router, token_router, general_router
 
 setup_logging()
 log = logging.getLogger(__name__)
 
+
+async def warm_up(app: FastAPI) -> None:
+    """Opens the pooled connections before the server starts accepting, so the first requests skip the handshakes"""
+    pools = {
+        'database': warm_up_engine(engine, settings.db.POOL_MIN_SIZE),
+        'redis': warm_up_redis(app.state.redis, settings.redis.POOL_MIN_SIZE),
+    }
+    if replica_engine is not None:
+        pools['replica'] = warm_up_engine(replica_engine, settings.db.POOL_MIN_SIZE)
+    results = await asyncio.gather(
+        *(asyncio.wait_for(warm, settings.lifespan.WARM_UP_TIMEOUT_SEC) for warm in pools.values()),
+        return_exceptions=True,
+    )
+    for name, result in zip(pools, results):
+        # a cold pool is no reason to refuse starting, connections are opened on demand as before
+        if isinstance(result, Exception):
+            log.error('Could not warm up %s connections: %r', name, result)
+        else:
+            log.info('Opened %s %s connections', result, name)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup = [asyncio.to_thread(configure_password_hashing), warm_up(app)]
+    if key_ring is not None:
+        # the first tokens are signed with a key generated here rather than on the request path
+        startup.append(asyncio.to_thread(key_ring.maintain))
+    await asyncio.gather(*startup)
+    tasks = [
+        asyncio.create_task(user_cache.listen(app.state.redis)),
+        asyncio.create_task(token_blacklist.run(app.state.redis)),
+        asyncio.create_task(login_stats.run()),
+    ]
+    if replica_monitor.engine is not None:
+        tasks.append(asyncio.create_task(replica_monitor.run()))
+    if key_ring is not None:
+        tasks.append(asyncio.create_task(key_ring.run()))
+    yield
+
+    # the server has stopped accepting connections, requests still arriving on open ones are refused
+    remaining = await request_drain.drain(settings.lifespan.DRAIN_TIMEOUT_SEC)
+    if remaining:
+        log.warning('Shutting down with %s requests still in flight', remaining)
+    for task in tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    await login_stats.flush()
+    await asyncio.to_thread(hashing_pool.shutdown)
+    await engine.dispose()
+    if replica_engine is not None:
+        await replica_engine.dispose()
+    await app.state.redis.aclose()
+
+
 app = FastAPI(
     title='Authentication',
     description='Authentication API documentation',
@@ -16,7 +90,28 @@ app = FastAPI(
     docs_url='/api/docs',
     redoc_url='/api/redoc',
     dependency_overrides={},
+    lifespan=lifespan,
 )
+app.state.redis = redis
+app.add_middleware(AuthenticationMiddleware)
+# added last, so the id is bound before authentication logs anything
+app.add_middleware(RequestIdMiddleware)
+# inside the metrics, so refused requests are counted
+app.add_middleware(DrainMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request: Request, error: PoolTimeoutError) -> JSONResponse:
+    log.error('Database pool exhausted: %s', error)
+    return JSONResponse({'detail': 'Database is busy, try again later'}, status_code=503, headers={'Retry-After': '1'})
+
+
+@app.get('/metrics', include_in_schema=False)
+async def metrics() -> Response:
+    return Response(registry.render(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 cors = CORSMiddleware(
     app=app,
     allow_methods=['*'],
@@ -0,0 +1,167 @@
+import bisect
+import time
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _sample(name: str, labels: str, value) -> str:
+    # a gauge that was never measured, like the lag of an unreachable replica, has no value
+    value = 'NaN' if value is None else value
+    return f'{name}{{{labels}}} {value}' if labels else f'{name} {value}'
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name: str, description: str) -> None:
+        self.name = name
+        self.description = description
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+    def samples(self, labels: str) -> list[str]:
+        return [_sample(self.name, labels, self.value)]
+
+
+class Gauge:
+    type = 'gauge'
+
+    def __init__(self, name: str, description: str) -> None:
+        self.name = name
+        self.description = description
+        self.value = 0
+
+    def set(self, value) -> None:
+        self.value = value
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: int = 1) -> None:
+        self.value -= amount
+
+    samples = Counter.samples
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name: str, description: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self) -> '_Timer':
+        return _Timer(self)
+
+    def samples(self, labels: str) -> list[str]:
+        prefix = f'{labels},' if labels else ''
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*map(float, self.buckets), '+Inf'), self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+        lines.append(_sample(f'{self.name}_sum', labels, self.sum))
+        lines.append(_sample(f'{self.name}_count', labels, self.count))
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram) -> None:
+        self.histogram = histogram
+
+    def __enter__(self) -> '_Timer':
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricFamily:
+    """One metric split by label values. A child is created on the first use of its label set and kept, so hot paths
+    can resolve their children once up front and skip the lookup.
+    """
+
+    def __init__(self, cls, name: str, description: str, labelnames: tuple[str, ...], *args) -> None:
+        self.cls = cls
+        self.type = cls.type
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self.args = args
+        self.children: dict[tuple[str, ...], Counter | Gauge | Histogram] = {}
+
+    def labels(self, *values: str):
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f'Metric {self.name} expects labels {self.labelnames}, got {values}')
+            child = self.children[values] = self.cls(self.name, self.description, *self.args)
+        return child
+
+    def samples(self, labels: str) -> list[str]:
+        lines = []
+        for values, child in list(self.children.items()):
+            lines.extend(
+                child.samples(','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, values)))
+            )
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self.metrics: dict[str, Counter | Gauge | Histogram | MetricFamily] = {}
+
+    def _get_or_create(self, cls, name: str, description: str, labelnames: tuple[str, ...], *args):
+        metric = self.metrics.get(name)
+        if metric is None:
+            if labelnames:
+                metric = MetricFamily(cls, name, description, labelnames, *args)
+            else:
+                metric = cls(name, description, *args)
+            self.metrics[name] = metric
+        elif (metric.cls if isinstance(metric, MetricFamily) else type(metric)) is not cls:
+            raise ValueError(f'Metric {name} already registered as {metric.type}')
+        return metric
+
+    def counter(self, name: str, description: str, labelnames: tuple[str, ...] = ()) -> Counter | MetricFamily:
+        return self._get_or_create(Counter, name, description, labelnames)
+
+    def gauge(self, name: str, description: str, labelnames: tuple[str, ...] = ()) -> Gauge | MetricFamily:
+        return self._get_or_create(Gauge, name, description, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        description: str,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+        labelnames: tuple[str, ...] = (),
+    ) -> Histogram | MetricFamily:
+        return self._get_or_create(Histogram, name, description, labelnames, buckets)
+
+    def render(self) -> str:
+        """Prometheus text exposition format 0.0.4"""
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.append(f'# HELP {metric.name} {metric.description}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.samples(''))
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
@@ -1,17 +1,224 @@
+import asyncio
 import logging
+import re
+import time
+from dataclasses import dataclass
+from uuid import uuid4
 
-from fastapi import Request
-from src.auth.dependencies import DatabaseDep
-from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi import HTTPException
+from redis.exceptions import RedisError
+from starlette.requests import HTTPConnection
+from starlette.responses import JSONResponse
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.auth.blacklist import filter_false_positives, revocation_filter, token_blacklist
+from src.auth.models import Role
+from src.config.security import JwtToken, token_cache
+from src.logger import request_id
+from src.metrics import Histogram, registry
 
 log = logging.getLogger(__name__)
 
+request_duration = registry.histogram(
+    'http_request_duration_seconds', 'Time to the end of the response per route', labelnames=('method', 'route')
+)
+requests_total = registry.counter(
+    'http_requests_total', 'Responses per route and status', labelnames=('method', 'route', 'status')
+)
+requests_in_flight = registry.gauge('http_requests_in_flight', 'Requests being processed')
+
+# anything else would let clients create label sets at will
+METHODS = frozenset({'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'})
+UNMATCHED_ROUTE = 'unmatched'
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+REQUEST_ID_PATTERN = re.compile(r'[\w.:-]{1,128}')
+
+
+@dataclass(frozen=True, slots=True)
+class AuthUser:
+    id: int
+    role: Role
+    groups: tuple[str, ...]
+
+
+class AuthenticationMiddleware:
+    """Resolves the access cookie into `request.auth` from the Redis session, without touching the database"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] in ('http', 'websocket'):
+            scope['auth'] = await self.authenticate(scope)
+        await self.app(scope, receive, send)
+
+    async def authenticate(self, scope: Scope) -> AuthUser | None:
+        access_token = HTTPConnection(scope).cookies.get('access')
+        if not access_token:
+            return None
+
+        try:
+            payload = JwtToken.decode_token(access_token, JwtToken.TokenType.ACCESS)
+        except HTTPException:
+            return None
+
+        jti = payload['jti']
+        redis = scope['app'].state.redis
+        try:
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.hgetall(f'session:{jti}')
+                sync_due = revocation_filter.sync_due
+                if sync_due:
+                    revocation_filter.queue_sync(pipe)
+                session, *stream = await pipe.execute()
+
+            if sync_due:
+                revocation_filter.apply_sync(stream[0])
+            is_blacklisted = False
+            if session and revocation_filter.might_be_revoked(jti):
+                is_blacklisted = await token_blacklist.contains(redis, jti, payload['exp'])
+                if not is_blacklisted:
+                    filter_false_positives.inc()
+        except RedisError as redis_error:
+            log.error('redis error while authenticating: %s', redis_error)
+            return None
+
+        if is_blacklisted or not session:
+            token_cache.invalidate(access_token)
+            return None
+
+        return AuthUser(
+            id=int(session['user_id']),
+            role=Role(session['role']),
+            groups=tuple(group for group in session['groups'].split(',') if group),
+        )
+
+
+class RequestIdMiddleware:
+    """Binds the request id to the logging context and echoes it back, a valid `X-Request-ID` from the caller is kept"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] not in ('http', 'websocket'):
+            await self.app(scope, receive, send)
+            return
+
+        incoming = HTTPConnection(scope).headers.get(REQUEST_ID_HEADER)
+        current_id = incoming if incoming and REQUEST_ID_PATTERN.fullmatch(incoming) else uuid4().hex
+
+        async def send_with_request_id(message: Message) -> None:
+            if message['type'] == 'http.response.start':
+                MutableHeaders(scope=message)[REQUEST_ID_HEADER] = current_id
+            await send(message)
+
+        token = request_id.set(current_id)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id.reset(token)
+
+
+class MetricsMiddleware:
+    """Per-route latency and status counts, labelled with the route template rather than the raw path"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self._durations: dict[tuple[str, str], Histogram] = {}
+
+    def _prepare(self, routes) -> None:
+        for route in routes:
+            for method in getattr(route, 'methods', None) or ():
+                self._durations[method, route.path] = request_duration.labels(method, route.path)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        if not self._durations:
+            self._prepare(scope['app'].routes)
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            requests_in_flight.dec()
+            # the router sets the matched route on the shared scope
+            route = scope.get('route')
+            method = scope['method'] if scope['method'] in METHODS else 'OTHER'
+            key = (method, route.path if route is not None else UNMATCHED_ROUTE)
+            duration = self._durations.get(key)
+            if duration is None:
+                duration = self._durations[key] = request_duration.labels(*key)
+            duration.observe(time.perf_counter() - started)
+            requests_total.labels(*key, str(status)).inc()
+
+
+class RequestDrain:
+    """Counts requests in flight, once draining starts new ones are refused and shutdown waits for the rest"""
+
+    def __init__(self) -> None:
+        self.in_flight = 0
+        self.draining = False
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def started(self) -> None:
+        self.in_flight += 1
+        self._idle.clear()
+
+    def finished(self) -> None:
+        self.in_flight -= 1
+        if not self.in_flight:
+            self._idle.set()
+
+    async def drain(self, timeout: float) -> int:
+        """Stops admitting requests and waits up to `timeout` for the running ones, returns how many are left"""
+        self.draining = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.in_flight
+
+
+request_drain = RequestDrain()
+
+
+class DrainMiddleware:
+    """Refuses requests that arrive on kept-alive connections after shutdown began, so draining has an end"""
+
+    def __init__(self, app: ASGIApp, drain: RequestDrain = request_drain) -> None:
+        self.app = app
+        self.drain = drain
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        if self.drain.draining:
+            response = JSONResponse(
+                {'detail': 'Service is shutting down'},
+                status_code=503,
+                headers={'Retry-After': '1', 'Connection': 'close'},
+            )
+            await response(scope, receive, send)
+            return
 
-# class DBSessionMiddleware(BaseHTTPMiddleware):
-#     def __init__(self, app, db: DatabaseDep):
-#         super().__init__(app)
-#         self._session = db
-#
-#     async def dispatch(self, request: Request, call_next):
-#         request.state.db = self._session
-#         return await call_next(request)
\ No newline at end of file
+        self.drain.started()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.drain.finished()
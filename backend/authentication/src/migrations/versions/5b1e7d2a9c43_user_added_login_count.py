@@ -0,0 +1,28 @@
+"""user added login_count
+
+Revision ID: 5b1e7d2a9c43
+Revises: c4cca8088630
+Create Date: 2026-10-18 12:40:11.502318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b1e7d2a9c43'
+down_revision: Union[str, Sequence[str], None] = 'c4cca8088630'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('login_count', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'login_count')
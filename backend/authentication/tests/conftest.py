@@ -1,13 +1,25 @@
+import pytest
 import pytest_asyncio
 from httpx import AsyncClient, ASGITransport
 from redis.asyncio import Redis
+from redis.asyncio.connection import AbstractConnection
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
+from src.auth.cache import user_cache
 from src.config import settings
 from src.config.db import Base, get_session, get_redis
+from src.config.keys import key_ring
 from src.main import app
 
 
+@pytest.fixture(scope='session', autouse=True)
+def keys_dir(tmp_path_factory):
+    """Ключи подписи пишутся во временный каталог, а не в ./keys рабочей копии"""
+    if key_ring is not None:
+        key_ring.directory = tmp_path_factory.mktemp('keys')
+
+
 @pytest_asyncio.fixture(scope='session')
 async def async_engine():
     """Асинхронный движок для SQLite"""
@@ -39,6 +51,29 @@ async def async_db_session(async_session_factory):
                 await session.rollback()
 
 
+@pytest_asyncio.fixture
+async def create_file_engine(tmp_path):
+    """Фабрика движков на отдельных файлах SQLite со схемой, для кода, который сам коммитит или держит соединения"""
+    engines = []
+
+    async def _create_engine(name: str = 'auth', **engine_options):
+        engine = create_async_engine(f'sqlite+aiosqlite:///{tmp_path}/{name}.db', **engine_options)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        engines.append(engine)
+        return engine
+
+    yield _create_engine
+    for engine in engines:
+        await engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def session_factory(create_file_engine):
+    """Сессии отдельной базы: импорт и сброс логинов коммитят сами, откатываемая сессия теста им не подходит"""
+    return async_sessionmaker(await create_file_engine(), class_=AsyncSession, expire_on_commit=False)
+
+
 @pytest_asyncio.fixture
 async def async_redis():
     redis = Redis(host=settings.redis.HOST, port=settings.redis.PORT, db=settings.redis.DB, decode_responses=True)
@@ -46,6 +81,34 @@ async def async_redis():
     await redis.aclose()
 
 
+@pytest_asyncio.fixture
+async def redis_round_trips(async_redis, monkeypatch):
+    """Счетчик сетевых обращений к Redis (одна пачка команд — один round trip)"""
+    await async_redis.ping()
+    calls = []
+    send_packed_command = AbstractConnection.send_packed_command
+
+    async def counting_send_packed_command(self, command, *args, **kwargs):
+        calls.append(command)
+        return await send_packed_command(self, command, *args, **kwargs)
+
+    monkeypatch.setattr(AbstractConnection, 'send_packed_command', counting_send_packed_command)
+    yield calls
+
+
+@pytest_asyncio.fixture
+async def sql_statements(async_engine):
+    """SQL-запросы, отправленные в базу во время теста"""
+    statements = []
+
+    def record_statement(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, 'before_cursor_execute', record_statement)
+    yield statements
+    event.remove(async_engine.sync_engine, 'before_cursor_execute', record_statement)
+
+
 @pytest_asyncio.fixture
 async def client(async_db_session, async_redis):
     def override_get_db():
@@ -57,6 +120,8 @@ async def client(async_db_session, async_redis):
     test_app = app
     test_app.dependency_overrides[get_session] = override_get_db
     test_app.dependency_overrides[get_redis] = override_get_redis
+    app_redis = test_app.state.redis
+    test_app.state.redis = async_redis
 
     async with AsyncClient(
         transport=ASGITransport(app=test_app),
@@ -66,3 +131,13 @@ async def client(async_db_session, async_redis):
         yield ac
 
     test_app.dependency_overrides.clear()
+    test_app.state.redis = app_redis
+    # ids are reused after the per-test rollback, cached users must not leak into the next test
+    user_cache.clear()
+    async for key in async_redis.scan_iter('user:*'):
+        await async_redis.delete(key)
+    async for key in async_redis.scan_iter('sessions:*'):
+        await async_redis.delete(key)
+    # every test logs in from the same address
+    async for key in async_redis.scan_iter('throttle:*'):
+        await async_redis.delete(key)
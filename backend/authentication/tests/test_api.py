@@ -1,4 +1,13 @@
 import pytest
+import pytest_asyncio
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from src.config import db
+from src.config.db import InstrumentedPool, get_session, pool_checked_out, pool_checkout_wait, pool_timeouts
+from src.main import app
+from tests.test_jwt import create_valid_token
+from tests.test_user import as_admin, create_valid_user
 
 
 @pytest.mark.asyncio
@@ -7,3 +16,84 @@ async def test_health_check(client):
     print(response.text)
     assert response.status_code == 200
     assert response.text == 'success'
+
+
+@pytest.mark.asyncio
+async def test_pool_exhaustion_returns_503(client):
+    engine = create_async_engine(
+        'sqlite+aiosqlite:///:memory:', poolclass=InstrumentedPool, pool_size=1, max_overflow=0, pool_timeout=0.1
+    )
+    timeouts, waits = pool_timeouts.value, pool_checkout_wait.count
+
+    async with engine.connect():
+        assert pool_checked_out.value == 1
+        async with AsyncSession(engine) as session:
+            app.dependency_overrides[get_session] = lambda: session
+            response = await client.get('/check/')
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert pool_timeouts.value == timeouts + 1
+    assert pool_checkout_wait.count == waits + 2
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def db_events(client, create_file_engine, monkeypatch):
+    """Запросы идут через настоящий get_session, в списке — события пула и транзакций"""
+    engine = await create_file_engine()
+
+    events = []
+    for name in ('begin', 'commit'):
+        event.listen(
+            engine.sync_engine,
+            name,
+            lambda conn, name=name: events.append((name, conn.get_execution_options().get('isolation_level'))),
+        )
+    event.listen(engine.sync_engine.pool, 'checkout', lambda *args: events.append(('checkout', None)))
+
+    factory_options = {'class_': AsyncSession, 'expire_on_commit': False, 'autoflush': False}
+    monkeypatch.setattr(db, 'async_session', async_sessionmaker(engine, **factory_options))
+    monkeypatch.setattr(
+        db,
+        'read_only_session',
+        async_sessionmaker(engine.execution_options(isolation_level='AUTOCOMMIT'), **factory_options),
+    )
+    app.dependency_overrides.pop(get_session)
+    yield events
+
+
+@pytest.mark.asyncio
+async def test_redis_only_request_skips_database(client, db_events, create_valid_user, create_valid_token):
+    await create_valid_user()
+    response = await create_valid_token()
+    client.cookies['access'] = response.cookies.get('access')
+    client.cookies['refresh'] = response.cookies.get('refresh')
+    db_events.clear()
+
+    response = await client.post('/token/delete/')
+    assert response.is_success
+    assert db_events == []
+
+
+@pytest.mark.asyncio
+async def test_read_only_request_runs_in_autocommit(client, db_events, create_valid_user):
+    user = await create_valid_user()
+    assert ('commit', None) in db_events
+    db_events.clear()
+
+    response = await client.get(f'/users/{user["id"]}/')
+    assert response.status_code == 200
+    assert db_events == [('checkout', None), ('begin', 'AUTOCOMMIT')]
+
+
+@pytest.mark.asyncio
+async def test_export_streams_inside_transaction(client, as_admin, db_events, create_valid_user):
+    """Серверный курсор Postgres живет только в транзакции, поэтому выгрузка не идет в autocommit"""
+    await create_valid_user()
+    db_events.clear()
+
+    response = await client.get('/users/', params={'format': 'ndjson'})
+    assert response.status_code == 200
+    assert len(response.text.splitlines()) == 1
+    assert [event for event in db_events if event[0] == 'begin'] == [('begin', 'SERIALIZABLE')]
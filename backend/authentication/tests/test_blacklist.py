@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+from src.auth.blacklist import BloomFilter, RevocationFilter, blacklist_size, revocation_filter, token_blacklist
+from src.config.security import JwtToken
+from tests.test_user import create_valid_user
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01, max_bytes=1024 * 1024)
+    items = [f'jti-{i}' for i in range(1000)]
+    for item in items:
+        bloom.add(item)
+
+    assert all(item in bloom for item in items)
+    false_positives = sum(f'other-{i}' in bloom for i in range(10_000))
+    assert false_positives < 300
+
+
+def test_bloom_filter_respects_memory_budget():
+    bloom = BloomFilter(capacity=1_000_000, error_rate=0.0001, max_bytes=1024)
+    assert len(bloom.bits) <= 1024
+
+
+@pytest.mark.asyncio
+async def test_revocation_filter_syncs_from_stream(async_redis):
+    local = RevocationFilter(capacity=1000, error_rate=0.01, max_bytes=1024, sync_interval_ms=0)
+    assert local.might_be_revoked('unknown')
+
+    async with async_redis.pipeline(transaction=False) as pipe:
+        revocation_filter.publish(pipe, 'revoked-jti')
+        await pipe.execute()
+
+    async with async_redis.pipeline(transaction=False) as pipe:
+        local.queue_sync(pipe)
+        (response,) = await pipe.execute()
+    local.apply_sync(response)
+
+    assert local.ready
+    assert local.might_be_revoked('revoked-jti')
+
+
+@pytest.mark.asyncio
+async def test_revoked_token_rejected_after_sync(client, create_valid_user, async_redis):
+    await create_valid_user()
+    response = await client.post('/token/create/', json={'username': 'user', 'password': 'password_123'})
+    access_token = response.cookies.get('access')
+    client.cookies['access'] = access_token
+    assert (await client.get('/users/me/')).status_code == 200
+
+    # revocation written by another worker: only the stream and the key, not this process' filter
+    payload = JwtToken.decode_token(access_token, JwtToken.TokenType.ACCESS)
+    jti = payload['jti']
+    async with async_redis.pipeline(transaction=False) as pipe:
+        token_blacklist.add(pipe, jti, payload['exp'])
+        await pipe.execute()
+    await async_redis.xadd(RevocationFilter.STREAM_KEY, {'jti': jti})
+    revocation_filter.synced_at = float('-inf')
+
+    assert (await client.get('/users/me/')).status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_blacklist_buckets_expire_with_tokens(async_redis):
+    exp = (int(time.time()) // 60 + 10) * 60 + 5
+    async with async_redis.pipeline(transaction=False) as pipe:
+        token_blacklist.add(pipe, 'first-jti', exp)
+        token_blacklist.add(pipe, 'second-jti', exp + 30)
+        token_blacklist.add(pipe, 'expired-jti', int(time.time()) - 1)
+        await pipe.execute()
+
+    key, _ = token_blacklist.entry('first-jti', exp)
+    assert key == token_blacklist.entry('second-jti', exp + 30)[0]
+    assert await async_redis.hlen(key) == 2
+    assert exp - time.time() < await async_redis.ttl(key) <= exp - time.time() + 61
+
+    assert await token_blacklist.contains(async_redis, 'first-jti', exp)
+    assert not await token_blacklist.contains(async_redis, 'expired-jti', int(time.time()) - 1)
+    assert not await token_blacklist.contains(async_redis, 'other-jti', exp)
+
+    assert await token_blacklist.measure(async_redis) >= 2
+    assert blacklist_size.value >= 2
@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+import pytest
+
+from src.auth.cache import UserCache, user_cache_loads
+from tests.test_user import create_valid_user
+
+
+@pytest.mark.asyncio
+async def test_user_read_is_cached_and_invalidated(client, create_valid_user):
+    user = await create_valid_user()
+    loads = user_cache_loads.value
+
+    for _ in range(3):
+        response = await client.get(f'/users/{user["id"]}/')
+        assert response.json()['username'] == 'user'
+    assert user_cache_loads.value == loads + 1
+
+    response = await client.patch(f'/users/{user["id"]}/', json={'username': 'user_new'})
+    assert response.status_code == 200
+
+    response = await client.get(f'/users/{user["id"]}/')
+    assert response.json()['username'] == 'user_new'
+    assert user_cache_loads.value == loads + 2
+
+
+@pytest.mark.asyncio
+async def test_cold_key_loads_once(async_redis):
+    cache = UserCache(local_size=10, local_ttl=30, redis_ttl=30, lock_ttl_ms=1000)
+    await async_redis.delete(cache.key(4242))
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {'id': 4242}
+
+    results = await asyncio.gather(*(cache.get(async_redis, 4242, 'public', loader) for _ in range(10)))
+    assert results == [{'id': 4242}] * 10
+    assert len(calls) == 1
+
+    # a second worker with a cold local tier is served from Redis
+    other_worker = UserCache(local_size=10, local_ttl=30, redis_ttl=30, lock_ttl_ms=1000)
+    assert await other_worker.get(async_redis, 4242, 'public', loader) == {'id': 4242}
+    assert len(calls) == 1
+    await async_redis.delete(cache.key(4242))
+
+
+@pytest.mark.asyncio
+async def test_missing_user_is_shared_with_waiting_workers(async_redis):
+    """Отсутствующий пользователь кешируется коротким маркером, ждущие воркеры не сидят весь TTL блокировки"""
+    cache = UserCache(local_size=10, local_ttl=30, redis_ttl=30, lock_ttl_ms=2000, miss_ttl_ms=500)
+    other_worker = UserCache(local_size=10, local_ttl=30, redis_ttl=30, lock_ttl_ms=2000, miss_ttl_ms=500)
+    await async_redis.delete(cache.key(4244))
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return None
+
+    started = time.monotonic()
+    holder = asyncio.create_task(cache.get(async_redis, 4244, 'public', loader))
+    await asyncio.sleep(0.02)
+    assert await other_worker.get(async_redis, 4244, 'public', loader) is None
+    assert await holder is None
+    assert time.monotonic() - started < 1
+    assert len(calls) == 1
+    assert 0 < await async_redis.pttl(cache.key(4244)) <= 500
+    await async_redis.delete(cache.key(4244))
+
+
+@pytest.mark.asyncio
+async def test_failed_load_releases_lock(async_redis):
+    """Ошибка загрузки снимает блокировку, и ждущий воркер сразу грузит сам"""
+    cache = UserCache(local_size=10, local_ttl=30, redis_ttl=30, lock_ttl_ms=2000)
+    other_worker = UserCache(local_size=10, local_ttl=30, redis_ttl=30, lock_ttl_ms=2000)
+    await async_redis.delete(cache.key(4245))
+
+    async def failing_loader():
+        await asyncio.sleep(0.1)
+        raise ValueError('database is down')
+
+    async def loader():
+        return {'id': 4245}
+
+    started = time.monotonic()
+    holder = asyncio.create_task(cache.get(async_redis, 4245, 'public', failing_loader))
+    await asyncio.sleep(0.02)
+    assert await other_worker.get(async_redis, 4245, 'public', loader) == {'id': 4245}
+    with pytest.raises(ValueError):
+        await holder
+    assert time.monotonic() - started < 1
+    assert not await async_redis.exists(f'{cache.key(4245)}:lock:public')
+    await async_redis.delete(cache.key(4245))
+
+
+@pytest.mark.asyncio
+async def test_invalidation_is_broadcast(async_redis):
+    cache = UserCache(local_size=10, local_ttl=30, redis_ttl=30, lock_ttl_ms=1000)
+    other_worker = UserCache(local_size=10, local_ttl=30, redis_ttl=30, lock_ttl_ms=1000)
+
+    async def loader():
+        return {'id': 4243}
+
+    await other_worker.get(async_redis, 4243, 'public', loader)
+    listener = asyncio.create_task(other_worker.listen(async_redis))
+    await asyncio.sleep(0.1)
+
+    await cache.invalidate(async_redis, 4243)
+    await asyncio.sleep(0.1)
+    assert other_worker._get_local((4243, 'public')) is None
+
+    listener.cancel()
+    await asyncio.gather(listener, return_exceptions=True)
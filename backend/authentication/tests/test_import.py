@@ -0,0 +1,140 @@
+import json
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import func, select
+
+from src.auth.dependencies import get_admin_user
+from src.auth.importer import UserImporter, iter_lines
+from src.auth.models import User
+from src.auth.repository import UserRepository
+from src.config.db import get_session
+from src.config.security import HashingPool, pwd_context
+from src.main import app
+from tests.test_jwt import create_valid_token
+from tests.test_user import create_valid_user
+
+CSV_ROWS = '\n'.join(
+    [
+        'username,password,email',
+        'import_1,password_1,one@mail.com',
+        'import_2,password_2,',
+        'bad,short,',
+        'import_1,password_3,',
+        'import_3,password_4,one@mail.com',
+        'import_4,password_5',
+    ]
+)
+
+
+async def chunks(data: str, size: int = 7):
+    # small chunks split lines and multi-byte characters across reads
+    encoded = data.encode()
+    for i in range(0, len(encoded), size):
+        yield encoded[i : i + size]
+
+
+@pytest_asyncio.fixture
+async def hashing_pool():
+    pool = HashingPool('thread', workers=2, max_queue=0)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_iter_lines_handles_split_chunks():
+    lines = [line async for line in iter_lines(chunks('first\r\nвторая\nlast', size=3))]
+    assert lines == ['first', 'вторая', 'last']
+
+
+@pytest.mark.asyncio
+async def test_import_reports_row_errors(session_factory, hashing_pool):
+    async with session_factory() as session:
+        importer = UserImporter(UserRepository(session), hashing_pool, batch_size=100)
+        report = await importer.run(iter_lines(chunks(CSV_ROWS)), 'csv')
+
+        assert report.created == 2
+        assert report.processed == 6
+        assert [(error.row, error.username) for error in report.errors] == [
+            (3, 'bad'),
+            (4, 'import_1'),
+            (5, 'import_3'),
+            (6, None),
+        ]
+        assert 'already exists' in report.errors[1].error
+
+        user = await UserRepository(session).get_user_by_username('import_1')
+        assert user.email == 'one@mail.com'
+        assert pwd_context.verify('password_1', user.password)
+
+
+@pytest.mark.asyncio
+async def test_import_csv_quoted_field_spans_lines(session_factory, hashing_pool):
+    data = 'username,password,email\r\nmultiline,"pass\r\n\r\n""word"" 1",\r\nimport_2,password_2,\r\n'
+    async with session_factory() as session:
+        importer = UserImporter(UserRepository(session), hashing_pool, batch_size=100)
+        report = await importer.run(iter_lines(chunks(data)), 'csv')
+
+        assert report.created == 2
+        assert report.processed == 2
+        assert report.errors == []
+        user = await UserRepository(session).get_user_by_username('multiline')
+        assert pwd_context.verify('pass\n\n"word" 1', user.password)
+
+
+@pytest.mark.asyncio
+async def test_import_resumes_from_checkpoint(session_factory, hashing_pool):
+    lines = [json.dumps({'username': f'resume_{i}', 'password': f'password_{i}'}) for i in range(5)]
+    lines.insert(2, '{broken')
+    data = '\n'.join(lines)
+    checkpoints = []
+
+    async def fail_after_first_batch(processed):
+        checkpoints.append(processed)
+        raise RuntimeError('connection lost')
+
+    async with session_factory() as session:
+        importer = UserImporter(UserRepository(session), hashing_pool, 2, fail_after_first_batch)
+        with pytest.raises(RuntimeError):
+            await importer.run(iter_lines(chunks(data)), 'ndjson')
+    assert checkpoints == [2]
+
+    async with session_factory() as session:
+        importer = UserImporter(UserRepository(session), hashing_pool, batch_size=2)
+        report = await importer.run(iter_lines(chunks(data)), 'ndjson', skip=checkpoints[-1])
+
+        assert report.created == 3
+        assert report.processed == 6
+        assert [error.row for error in report.errors] == [3]
+        assert report.errors[0].error.startswith('Malformed JSON')
+        assert await session.scalar(select(func.count()).select_from(User)) == 5
+
+
+@pytest.mark.asyncio
+async def test_import_endpoint(client, session_factory):
+    async def override_get_session():
+        async with session_factory() as session:
+            yield session
+
+    app.dependency_overrides[get_session] = override_get_session
+    app.dependency_overrides[get_admin_user] = lambda: None
+
+    response = await client.post('/users/import/', content=CSV_ROWS, headers={'Content-Type': 'text/csv'})
+    assert response.status_code == 200
+    report = response.json()
+    assert report['created'] == 2
+    assert report['processed'] == 6
+    assert len(report['errors']) == 4
+
+    response = await client.post('/users/import/?skip=6', content=CSV_ROWS, headers={'Content-Type': 'text/csv'})
+    assert response.json() == {'created': 0, 'processed': 6, 'errors': []}
+
+
+@pytest.mark.asyncio
+async def test_import_requires_admin(client, create_valid_user, create_valid_token):
+    await create_valid_user()
+    response = await create_valid_token()
+    client.cookies['access'] = response.cookies.get('access')
+
+    response = await client.post('/users/import/', content=CSV_ROWS, headers={'Content-Type': 'text/csv'})
+    assert response.status_code == 403
@@ -1,7 +1,11 @@
+import time
+
 import pytest
 import pytest_asyncio
+from fastapi import HTTPException
 
-from src.config.security import JwtToken
+from src.auth.blacklist import RevocationFilter, token_blacklist
+from src.config.security import JwtToken, TokenCache, token_cache, token_cache_evictions, token_cache_hits
 from tests.test_user import create_valid_user
 
 @pytest_asyncio.fixture
@@ -84,8 +88,7 @@ async def test_refresh_blacklist(client, create_valid_user, create_valid_token,
     response = await client.post('/token/refresh/')
     assert response.status_code == 204
 
-    redis_response = await async_redis.get(f'blacklist:{decoded_access_token.get('jti')}')
-    assert redis_response is not None
+    assert await token_blacklist.contains(async_redis, decoded_access_token['jti'], decoded_access_token['exp'])
 
 
 @pytest.mark.asyncio
@@ -105,7 +108,51 @@ async def test_logout_blacklist(client, create_valid_user, create_valid_token, a
     assert response.cookies.get('access') is None
     assert response.cookies.get('refresh') is None
 
-    redis_response = await async_redis.get(f'blacklist:{decoded_access_token.get("jti")}')
-    assert redis_response is not None
-    redis_response = await async_redis.get(f'blacklist:{decoded_refresh_token.get("jti")}')
-    assert redis_response is not None
\ No newline at end of file
+    assert await token_blacklist.contains(async_redis, decoded_access_token['jti'], decoded_access_token['exp'])
+    assert await token_blacklist.contains(async_redis, decoded_refresh_token['jti'], decoded_refresh_token['exp'])
+    assert not await async_redis.exists(f'session:{decoded_access_token["jti"]}')
+
+    published = [fields['jti'] for _, fields in await async_redis.xrange(RevocationFilter.STREAM_KEY)]
+    assert decoded_access_token['jti'] in published
+    assert decoded_refresh_token['jti'] not in published
+
+
+def test_decode_token_uses_cache():
+    token, _ = JwtToken.create_token({'sub': '1'}, JwtToken.TokenType.ACCESS)
+    hits = token_cache_hits.value
+
+    first = JwtToken.decode_token(token, JwtToken.TokenType.ACCESS)
+    second = JwtToken.decode_token(token, JwtToken.TokenType.ACCESS)
+    assert first == second
+    assert token_cache_hits.value == hits + 1
+
+    with pytest.raises(HTTPException):
+        JwtToken.decode_token(token, JwtToken.TokenType.REFRESH)
+
+
+def test_token_cache_expiry_and_eviction():
+    cache = TokenCache(maxsize=2)
+    evictions = token_cache_evictions.value
+
+    cache.set('expired', {'exp': time.time() - 1})
+    assert cache.get('expired') is None
+
+    cache.set('first', {'exp': time.time() + 60})
+    cache.set('second', {'exp': time.time() + 60})
+    cache.set('third', {'exp': time.time() + 60})
+    assert cache.get('first') is None
+    assert cache.get('third') is not None
+    assert token_cache_evictions.value == evictions + 1
+
+
+@pytest.mark.asyncio
+async def test_blacklist_invalidates_cache(client, create_valid_user, create_valid_token):
+    await create_valid_user()
+    response = await create_valid_token()
+    access_token = response.cookies.get('access')
+    JwtToken.decode_token(access_token, JwtToken.TokenType.ACCESS)
+    assert token_cache.get(access_token) is not None
+
+    client.cookies['access'] = access_token
+    await client.post('/token/delete/')
+    assert token_cache.get(access_token) is None
@@ -0,0 +1,114 @@
+import os
+import time
+from uuid import uuid4
+
+import jwt
+import pytest
+
+from src.config import security, settings
+from src.config.keys import KeyRing
+from src.config.security import JwtToken
+
+
+@pytest.fixture
+def key_ring(tmp_path, monkeypatch):
+    ring = KeyRing('EdDSA', str(tmp_path), rotation_seconds=3600, retention_seconds=3600)
+    monkeypatch.setattr(settings.auth, 'ALGORITHM', 'EdDSA')
+    monkeypatch.setattr(security, 'key_ring', ring)
+    monkeypatch.setattr('src.auth.routes.key_ring', ring)
+    return ring
+
+
+@pytest.mark.parametrize('algorithm', ['RS256', 'ES256', 'EdDSA'])
+def test_key_ring_signs_with_kid(tmp_path, algorithm):
+    ring = KeyRing(algorithm, str(tmp_path), rotation_seconds=3600, retention_seconds=3600)
+    signing_key = ring.signing_key()
+    token = jwt.encode({'sub': '1'}, signing_key.private_key, algorithm=algorithm, headers={'kid': signing_key.kid})
+
+    kid = jwt.get_unverified_header(token)['kid']
+    assert jwt.decode(token, ring.verification_key(kid), algorithms=[algorithm]) == {'sub': '1'}
+    assert (tmp_path / f'{kid}.pem').exists()
+
+
+def test_key_ring_rotation_keeps_old_keys(key_ring):
+    old_token, _ = JwtToken.create_token({'sub': '1'}, JwtToken.TokenType.ACCESS)
+    old_kid = key_ring.active.kid
+
+    expired = time.time() - key_ring.rotation_seconds - 1
+    os.utime(key_ring.directory / f'{old_kid}.pem', (expired, expired))
+    key_ring.keys = {}
+    key_ring.load()
+    # requests keep signing with the old key until maintenance rotates it
+    token, _ = JwtToken.create_token({'sub': '1'}, JwtToken.TokenType.ACCESS)
+    assert jwt.get_unverified_header(token)['kid'] == old_kid
+
+    key_ring.maintain()
+    new_token, _ = JwtToken.create_token({'sub': '1'}, JwtToken.TokenType.ACCESS)
+
+    assert key_ring.active.kid != old_kid
+    assert jwt.get_unverified_header(new_token)['kid'] == key_ring.active.kid
+    assert JwtToken.decode_token(old_token, JwtToken.TokenType.ACCESS)['sub'] == '1'
+
+
+def test_maintain_rotates_ahead_of_expiry(key_ring):
+    key_ring.maintain()
+    first = key_ring.active
+    # within one check of the rotation age, so it would expire before the next check
+    due = time.time() - key_ring.rotation_seconds + key_ring.check_interval / 2
+    os.utime(key_ring.directory / f'{first.kid}.pem', (due, due))
+    key_ring.keys = {}
+
+    key_ring.maintain()
+    assert key_ring.active.kid != first.kid
+    assert set(key_ring.keys) == {first.kid, key_ring.active.kid}
+
+
+def test_unknown_kids_reload_at_most_once_per_interval(key_ring, monkeypatch):
+    key_ring.maintain()
+    loads = []
+    load = key_ring.load
+    monkeypatch.setattr(key_ring, 'load', lambda: loads.append(1) or load())
+
+    for kid in ('../../etc/passwd', None, 'not-a-kid'):
+        with pytest.raises(jwt.InvalidKeyError):
+            key_ring.verification_key(kid)
+    assert loads == []
+
+    for _ in range(3):
+        with pytest.raises(jwt.InvalidKeyError):
+            key_ring.verification_key(uuid4().hex)
+    assert loads == []
+
+    key_ring._loaded_at -= key_ring.reload_interval
+    with pytest.raises(jwt.InvalidKeyError):
+        key_ring.verification_key(uuid4().hex)
+    assert loads == [1]
+
+
+def test_missing_directory_fails_without_create(tmp_path):
+    ring = KeyRing('EdDSA', str(tmp_path / 'missing'), 3600, 3600, create_directory=False)
+    with pytest.raises(FileNotFoundError):
+        ring.maintain()
+    assert not (tmp_path / 'missing').exists()
+
+
+def test_key_ring_is_shared_between_workers(key_ring):
+    token, _ = JwtToken.create_token({'sub': '1'}, JwtToken.TokenType.ACCESS)
+    other_worker = KeyRing('EdDSA', str(key_ring.directory), rotation_seconds=3600, retention_seconds=3600)
+    kid = jwt.get_unverified_header(token)['kid']
+    assert jwt.decode(token, other_worker.verification_key(kid), algorithms=['EdDSA'])['sub'] == '1'
+
+
+@pytest.mark.asyncio
+async def test_jwks_endpoint(client, key_ring):
+    response = await client.get('/.well-known/jwks.json')
+    assert response.status_code == 200
+    jwks = response.json()
+    assert [key['kid'] for key in jwks['keys']] == [key_ring.active.kid]
+
+    token, _ = JwtToken.create_token({'sub': '1'}, JwtToken.TokenType.ACCESS)
+    public_key = jwt.PyJWK(jwks['keys'][0]).key
+    assert jwt.decode(token, public_key, algorithms=['EdDSA'])['sub'] == '1'
+
+    response = await client.get('/.well-known/jwks.json', headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
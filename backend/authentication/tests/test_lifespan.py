@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from redis.asyncio import Redis
+from starlette.responses import PlainTextResponse
+
+from src.config import settings
+from src.config.db import warm_up_engine, warm_up_redis
+from src.middleware import DrainMiddleware, RequestDrain
+
+
+@pytest.mark.asyncio
+async def test_warm_up_engine_fills_pool(create_file_engine):
+    """Соединения открываются заранее и возвращаются в пул, но не больше pool_size"""
+    engine = await create_file_engine('warm', pool_size=3)
+    # start from an empty pool, creating the schema left a connection in it
+    await engine.dispose()
+    assert await warm_up_engine(engine, 5) == 3
+    assert engine.pool.checkedin() == 3
+    assert engine.pool.checkedout() == 0
+
+
+@pytest.mark.asyncio
+async def test_warm_up_redis_connects_pool():
+    """Прогретые соединения уже подключены и лежат в пуле свободными"""
+    redis = Redis(host=settings.redis.HOST, port=settings.redis.PORT, db=settings.redis.DB)
+    try:
+        assert await warm_up_redis(redis, 3) == 3
+        available = redis.connection_pool._available_connections
+        assert len(available) == 3
+        assert all(connection.is_connected for connection in available)
+    finally:
+        await redis.aclose()
+
+
+def drained_app(drain: RequestDrain, release: asyncio.Event):
+    async def slow_app(scope, receive, send):
+        await release.wait()
+        await PlainTextResponse('done')(scope, receive, send)
+
+    return DrainMiddleware(slow_app, drain=drain)
+
+
+@pytest.mark.asyncio
+async def test_drain_waits_for_requests_in_flight():
+    """Остановка ждет начатый запрос, а новые запросы получают 503"""
+    drain, release = RequestDrain(), asyncio.Event()
+    async with AsyncClient(transport=ASGITransport(app=drained_app(drain, release)), base_url='http://test') as client:
+        in_flight = asyncio.create_task(client.get('/'))
+        await asyncio.sleep(0.05)
+        assert drain.in_flight == 1
+
+        draining = asyncio.create_task(drain.drain(timeout=5))
+        await asyncio.sleep(0.05)
+        refused = await client.get('/')
+        assert refused.status_code == 503
+        assert refused.headers['connection'] == 'close'
+
+        release.set()
+        assert (await in_flight).text == 'done'
+        assert await draining == 0
+
+
+@pytest.mark.asyncio
+async def test_drain_gives_up_at_deadline():
+    """По истечении срока остановка продолжается и сообщает о незавершенных запросах"""
+    drain, release = RequestDrain(), asyncio.Event()
+    async with AsyncClient(transport=ASGITransport(app=drained_app(drain, release)), base_url='http://test') as client:
+        in_flight = asyncio.create_task(client.get('/'))
+        await asyncio.sleep(0.05)
+        assert await drain.drain(timeout=0.05) == 1
+        release.set()
+        await in_flight
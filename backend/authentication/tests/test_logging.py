@@ -0,0 +1,83 @@
+import io
+import json
+import logging
+
+import pytest
+
+from src.logger import (
+    ColoredFormatter,
+    JsonFormatter,
+    LazyQueueHandler,
+    RequestIdFilter,
+    SamplingFilter,
+    _text_formatter,
+    request_id,
+)
+
+
+def make_record(name='src.auth.service', level=logging.WARNING, msg='User not found with id: %s', args=(1,)):
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+
+def test_sampling_filter_applies_to_logger_and_children():
+    sampling = SamplingFilter({'src.auth.service.failed_login': 0})
+    assert not sampling.filter(make_record('src.auth.service.failed_login'))
+    assert not sampling.filter(make_record('src.auth.service.failed_login.child', logging.DEBUG))
+    assert sampling.filter(make_record('src.auth.service.failed_login', logging.ERROR))
+    assert sampling.filter(make_record('src.auth.service'))
+    assert SamplingFilter({'src': 1}).filter(make_record())
+
+
+def test_queue_handler_defers_formatting():
+    class Unformattable:
+        def __str__(self):
+            raise AssertionError('formatted on the calling thread')
+
+    record = make_record(args=(Unformattable(),))
+    assert LazyQueueHandler(None).prepare(record) is record
+    assert not hasattr(record, 'message')
+
+
+def test_json_formatter_adds_request_id():
+    token = request_id.set('req-1')
+    try:
+        record = make_record()
+        RequestIdFilter().filter(record)
+    finally:
+        request_id.reset(token)
+    record.sample_rate = 0.5
+
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry['message'] == 'User not found with id: 1'
+    assert entry['request_id'] == 'req-1'
+    assert entry['sample_rate'] == 0.5
+    assert entry['level'] == 'WARNING'
+
+
+def test_colour_only_on_tty():
+    class Terminal(io.StringIO):
+        def isatty(self):
+            return True
+
+    assert isinstance(_text_formatter(Terminal()), ColoredFormatter)
+    assert not isinstance(_text_formatter(io.StringIO()), ColoredFormatter)
+
+
+@pytest.mark.asyncio
+async def test_request_id_reaches_logs_and_response(client):
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    handler.addFilter(RequestIdFilter())
+    logger = logging.getLogger('src.auth.service')
+    logger.addHandler(handler)
+    try:
+        response = await client.get('/users/999999/', headers={'X-Request-ID': 'trace-42'})
+        generated = await client.get('/users/999999/', headers={'X-Request-ID': 'not valid\n'})
+    finally:
+        logger.removeHandler(handler)
+
+    assert response.status_code == 404
+    assert response.headers['X-Request-ID'] == 'trace-42'
+    assert generated.headers['X-Request-ID'] not in ('trace-42', 'not valid\n')
+    assert [record.request_id for record in records] == ['trace-42', generated.headers['X-Request-ID']]
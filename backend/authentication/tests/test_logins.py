@@ -0,0 +1,90 @@
+from datetime import datetime
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+
+from src.auth.logins import LoginStats, login_stats, login_stats_failures
+from src.auth.models import User
+from src.auth.repository import UserRepository
+from tests.test_jwt import create_valid_token
+from tests.test_user import create_valid_user
+
+
+@pytest_asyncio.fixture
+async def session_factory(session_factory):
+    """Отдельная база с двумя пользователями"""
+    async with session_factory() as session:
+        for username in ('first', 'second'):
+            await UserRepository(session).create_user(username, 'password')
+        await session.commit()
+    return session_factory
+
+
+async def load_logins(session_factory) -> dict:
+    async with session_factory() as session:
+        rows = await session.execute(select(User.username, User.latest_login, User.login_count))
+        return {username: (latest, count) for username, latest, count in rows}
+
+
+@pytest.mark.asyncio
+async def test_flush_writes_buffered_logins(session_factory):
+    stats = LoginStats(session_factory, flush_interval=60, max_pending=100)
+    stats.record(1)
+    stats.record(1)
+    stats.record(2)
+
+    assert await stats.flush() == 2
+    logins = await load_logins(session_factory)
+    assert logins['first'][1] == 2
+    assert logins['second'][1] == 1
+    assert logins['first'][0] is not None
+
+    stats.record(2)
+    assert await stats.flush() == 1
+    assert (await load_logins(session_factory))['second'][1] == 2
+    assert await stats.flush() == 0
+
+
+@pytest.mark.asyncio
+async def test_flush_keeps_latest_login_monotonic(session_factory):
+    future = datetime(2100, 1, 1)
+    async with session_factory() as session:
+        await UserRepository(session).record_logins([(1, future, 1)])
+        await session.commit()
+
+    stats = LoginStats(session_factory, flush_interval=60, max_pending=100)
+    stats.record(1)
+    await stats.flush()
+    assert (await load_logins(session_factory))['first'] == (future, 2)
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_is_retried(session_factory, monkeypatch):
+    stats = LoginStats(session_factory, flush_interval=60, max_pending=100)
+    stats.record(1)
+    failures = login_stats_failures.value
+
+    async def fail(self, logins):
+        raise OperationalError('UPDATE', {}, Exception('database is down'))
+
+    with monkeypatch.context() as patch:
+        patch.setattr(UserRepository, 'record_logins', fail)
+        assert await stats.flush() == 0
+    assert login_stats_failures.value == failures + 1
+
+    stats.record(1)
+    assert await stats.flush() == 1
+    assert (await load_logins(session_factory))['first'][1] == 2
+
+
+@pytest.mark.asyncio
+async def test_login_is_buffered(client, create_valid_user, create_valid_token, sql_statements, monkeypatch):
+    monkeypatch.setattr(login_stats, '_pending', {})
+    user = await create_valid_user()
+    sql_statements.clear()
+
+    assert (await create_valid_token()).status_code == 204
+    assert not any(statement.startswith('UPDATE') for statement in sql_statements)
+    assert login_stats._pending[user['id']][1] == 1
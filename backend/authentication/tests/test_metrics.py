@@ -0,0 +1,122 @@
+import pytest
+from sqlalchemy import text
+
+from src.config import settings
+from src.config.db import InstrumentedRedis, instrument_engine, redis_command_duration, statement_duration
+from src.config.security import JwtToken, jwt_decode_duration, jwt_encode_duration, password_verify_duration
+from src.metrics import MetricsRegistry
+from src.middleware import request_duration, requests_in_flight, requests_total
+from tests.test_jwt import create_valid_token
+from tests.test_user import create_valid_user
+
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    registry.counter('jobs_total', 'Jobs').inc(3)
+    registry.gauge('lag_seconds', 'Lag').set(None)
+    latency = registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1), labelnames=('route',))
+    latency.labels('/a"b').observe(0.5)
+    latency.labels('/a"b').observe(2)
+
+    assert registry.render().splitlines() == [
+        '# HELP jobs_total Jobs',
+        '# TYPE jobs_total counter',
+        'jobs_total 3',
+        '# HELP lag_seconds Lag',
+        '# TYPE lag_seconds gauge',
+        'lag_seconds NaN',
+        '# HELP latency_seconds Latency',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{route="/a\\"b",le="0.1"} 0',
+        'latency_seconds_bucket{route="/a\\"b",le="1.0"} 1',
+        'latency_seconds_bucket{route="/a\\"b",le="+Inf"} 2',
+        'latency_seconds_sum{route="/a\\"b"} 2.5',
+        'latency_seconds_count{route="/a\\"b"} 2',
+    ]
+
+
+def test_registry_reuses_label_sets():
+    registry = MetricsRegistry()
+    family = registry.counter('calls_total', 'Calls', labelnames=('op',))
+    assert family.labels('read') is family.labels('read')
+    assert registry.counter('calls_total', 'Calls', labelnames=('op',)) is family
+    with pytest.raises(ValueError):
+        family.labels('read', 'extra')
+    with pytest.raises(ValueError):
+        registry.gauge('calls_total', 'Calls')
+
+
+@pytest.mark.asyncio
+async def test_requests_are_labelled_by_route(client, create_valid_user):
+    user = await create_valid_user()
+    route = '/api/v1/users/{user_id}/'
+    count = request_duration.labels('GET', route).count
+    ok = requests_total.labels('GET', route, '200').value
+    missing = requests_total.labels('GET', route, '404').value
+
+    await client.get(f'/users/{user["id"]}/')
+    await client.get('/users/999999/')
+    await client.get('/no/such/path/')
+
+    assert request_duration.labels('GET', route).count == count + 2
+    assert requests_total.labels('GET', route, '200').value == ok + 1
+    assert requests_total.labels('GET', route, '404').value == missing + 1
+    assert requests_total.labels('GET', 'unmatched', '404').value >= 1
+    assert requests_in_flight.value == 0
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(client, create_valid_user, create_valid_token):
+    await create_valid_user()
+    verified = password_verify_duration.count
+    encoded = jwt_encode_duration.count
+    await create_valid_token()
+    assert password_verify_duration.count == verified + 1
+    assert jwt_encode_duration.count == encoded + 2
+
+    response = await client.get('http://test/metrics')
+    assert response.status_code == 200
+    assert response.headers['content-type'].startswith('text/plain; version=0.0.4')
+    body = response.text
+    assert '# TYPE http_request_duration_seconds histogram' in body
+    assert 'http_request_duration_seconds_count{method="POST",route="/api/v1/token/create/"}' in body
+    assert 'auth_jwt_duration_seconds_count{operation="encode"}' in body
+
+
+def test_jwt_decode_is_timed():
+    token, _ = JwtToken.create_token({'sub': '1'}, JwtToken.TokenType.ACCESS)
+    decoded = jwt_decode_duration.count
+    JwtToken.decode_token(token, JwtToken.TokenType.ACCESS)
+    assert jwt_decode_duration.count == decoded + 1
+
+
+@pytest.mark.asyncio
+async def test_statements_are_timed_by_kind(create_file_engine):
+    engine = instrument_engine(await create_file_engine('metrics'))
+    selects = statement_duration.labels('SELECT').count
+    others = statement_duration.labels('OTHER').count
+    async with engine.connect() as conn:
+        await conn.execute(text('SELECT 1'))
+        with pytest.raises(Exception):
+            await conn.execute(text('SELECT * FROM missing'))
+        await conn.execute(text('CREATE TABLE t (id INTEGER)'))
+    await engine.dispose()
+
+    assert statement_duration.labels('SELECT').count == selects + 1
+    assert statement_duration.labels('OTHER').count == others + 1
+
+
+@pytest.mark.asyncio
+async def test_redis_commands_are_timed():
+    redis = InstrumentedRedis(host=settings.redis.HOST, port=settings.redis.PORT, decode_responses=True)
+    gets = redis_command_duration.labels('GET').count
+    transactions = redis_command_duration.labels('MULTI').count
+    await redis.get('metrics:missing')
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.get('metrics:missing')
+        pipe.get('metrics:missing')
+        await pipe.execute()
+    await redis.aclose()
+
+    assert redis_command_duration.labels('GET').count == gets + 1
+    assert redis_command_duration.labels('MULTI').count == transactions + 1
@@ -0,0 +1,49 @@
+import pytest
+
+from src.auth.families import ROTATE_SCRIPT
+from tests.test_jwt import create_valid_token
+from tests.test_user import create_valid_user
+
+
+@pytest.mark.asyncio
+async def test_create_token_round_trips(client, create_valid_user, create_valid_token, redis_round_trips):
+    await create_valid_user()
+    # the first login also loads the throttle script
+    await create_valid_token()
+    client.cookies.clear()
+    redis_round_trips.clear()
+
+    response = await create_valid_token()
+    assert response.status_code == 204
+    # throttle check + pipelined session write
+    assert len(redis_round_trips) == 2
+
+
+@pytest.mark.asyncio
+async def test_refresh_token_round_trips(
+    client, create_valid_user, create_valid_token, async_redis, redis_round_trips
+):
+    await create_valid_user()
+    response = await create_valid_token()
+    client.cookies['access'] = response.cookies.get('access')
+    client.cookies['refresh'] = response.cookies.get('refresh')
+    await async_redis.script_load(ROTATE_SCRIPT)
+    redis_round_trips.clear()
+
+    response = await client.post('/token/refresh/')
+    assert response.status_code == 204
+    # session lookup in AuthenticationMiddleware + rotation with the pipelined writes
+    assert len(redis_round_trips) == 2
+
+
+@pytest.mark.asyncio
+async def test_delete_token_round_trips(client, create_valid_user, create_valid_token, redis_round_trips):
+    await create_valid_user()
+    response = await create_valid_token()
+    client.cookies['access'] = response.cookies.get('access')
+    client.cookies['refresh'] = response.cookies.get('refresh')
+    redis_round_trips.clear()
+
+    response = await client.post('/token/delete/')
+    assert response.is_success
+    assert len(redis_round_trips) == 2
@@ -0,0 +1,95 @@
+import pytest
+
+from src.auth.blacklist import token_blacklist
+from src.auth.families import refresh_reuses
+from src.config.security import JwtToken
+from tests.test_jwt import create_valid_token
+from tests.test_user import create_valid_user
+
+
+async def login(client, create_valid_token):
+    response = await create_valid_token()
+    client.cookies['access'] = response.cookies.get('access')
+    client.cookies['refresh'] = response.cookies.get('refresh')
+    return response
+
+
+async def refresh(client, refresh_token, access_token=None):
+    client.cookies.clear()
+    client.cookies['refresh'] = refresh_token
+    if access_token:
+        client.cookies['access'] = access_token
+    return await client.post('/token/refresh/')
+
+
+@pytest.mark.asyncio
+async def test_refresh_rotates_refresh_token(client, create_valid_user, create_valid_token, async_redis):
+    await create_valid_user()
+    first = await login(client, create_valid_token)
+    first_refresh = first.cookies.get('refresh')
+
+    second = await refresh(client, first_refresh)
+    assert second.status_code == 204
+    second_refresh = second.cookies.get('refresh')
+    assert second_refresh not in (None, first_refresh)
+
+    old_token = JwtToken.decode_token(first_refresh, JwtToken.TokenType.REFRESH)
+    assert await token_blacklist.contains(async_redis, old_token['jti'], old_token['exp'])
+    family = JwtToken.decode_token(second_refresh, JwtToken.TokenType.REFRESH)['fam']
+    assert family == JwtToken.decode_token(first_refresh, JwtToken.TokenType.REFRESH)['fam']
+    assert await async_redis.ttl(f'refresh:family:{family}') > 0
+
+    assert (await refresh(client, second_refresh)).status_code == 204
+
+
+@pytest.mark.asyncio
+async def test_reused_refresh_token_revokes_family(client, create_valid_user, create_valid_token):
+    await create_valid_user()
+    first = await login(client, create_valid_token)
+    stolen_refresh = first.cookies.get('refresh')
+
+    rotated = await refresh(client, stolen_refresh)
+    holder_access = rotated.cookies.get('access')
+    holder_refresh = rotated.cookies.get('refresh')
+    reuses = refresh_reuses.value
+
+    assert (await refresh(client, stolen_refresh)).status_code == 401
+    assert refresh_reuses.value == reuses + 1
+    # the legitimate holder is logged out along with the attacker
+    assert (await refresh(client, holder_refresh)).status_code == 401
+    client.cookies.clear()
+    client.cookies['access'] = holder_access
+    assert (await client.get('/users/me/')).status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_logout_revokes_family(client, create_valid_user, create_valid_token):
+    await create_valid_user()
+    response = await login(client, create_valid_token)
+    refresh_token = response.cookies.get('refresh')
+
+    await client.post('/token/delete/')
+    assert (await refresh(client, refresh_token)).status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_refresh_token_without_family_starts_one(client, create_valid_user, create_valid_token):
+    """Токены, выпущенные до появления семейств, обмениваются один раз"""
+    await create_valid_user()
+    response = await login(client, create_valid_token)
+    sub = JwtToken.decode_token(response.cookies.get('refresh'), JwtToken.TokenType.REFRESH)['sub']
+    legacy_refresh, _ = JwtToken.create_token({'username': 'user', 'sub': sub}, JwtToken.TokenType.REFRESH)
+
+    assert (await refresh(client, legacy_refresh)).status_code == 204
+    assert (await refresh(client, legacy_refresh)).status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_rotation_survives_script_flush(client, create_valid_user, create_valid_token, async_redis):
+    await create_valid_user()
+    response = await login(client, create_valid_token)
+    await async_redis.script_flush()
+
+    response = await refresh(client, response.cookies.get('refresh'))
+    assert response.status_code == 204
+    assert (await refresh(client, response.cookies.get('refresh'))).status_code == 204
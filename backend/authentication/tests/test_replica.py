@@ -0,0 +1,80 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.auth.models import User
+from src.auth.repository import UserRepository
+from src.config.db import ReplicaMonitor, RoutingSession
+
+
+@pytest_asyncio.fixture
+async def databases(create_file_engine):
+    """Первичная база и реплика с разными данными, чтобы было видно, куда ушел запрос"""
+    engines = []
+    for name in ('primary', 'replica'):
+        engine = await create_file_engine(name)
+        async with engine.begin() as conn:
+            await conn.execute(User.__table__.insert().values(id=1, username=name, password='hash'))
+        engines.append(engine)
+    return tuple(engines)
+
+
+@pytest_asyncio.fixture
+async def replica_monitor(databases):
+    _, replica = databases
+    monitor = ReplicaMonitor(replica, max_lag=1, check_interval=60)
+    monitor.lag_query = text('SELECT 0.5')
+    await monitor.check()
+    return monitor
+
+
+@pytest.fixture
+def session_factory(databases, replica_monitor):
+    primary, _ = databases
+    return async_sessionmaker(
+        primary, class_=AsyncSession, sync_session_class=RoutingSession, replica=replica_monitor, expire_on_commit=False
+    )
+
+
+@pytest.mark.asyncio
+async def test_reads_go_to_replica(session_factory, replica_monitor):
+    assert replica_monitor.available
+    async with session_factory() as session:
+        user = await UserRepository(session).get_user_by_username('replica')
+        assert user is not None
+
+
+@pytest.mark.asyncio
+async def test_reads_after_write_are_pinned_to_primary(session_factory):
+    async with session_factory() as session:
+        repository = UserRepository(session)
+        await repository.create_user('new_user', 'hash')
+        assert await repository.get_user_by_username('primary') is not None
+        assert await repository.get_user_by_username('replica') is None
+        await session.commit()
+
+        # still pinned after the commit, the replica may not have the new row yet
+        assert await repository.get_user_by_username('new_user') is not None
+
+
+@pytest.mark.asyncio
+async def test_lagging_replica_falls_back_to_primary(session_factory, replica_monitor):
+    replica_monitor.lag_query = text('SELECT 5')
+    replica_monitor.checked_at = float('-inf')
+    assert await replica_monitor.check() == 5
+    assert not replica_monitor.available
+
+    async with session_factory() as session:
+        assert await UserRepository(session).get_user_by_username('primary') is not None
+
+
+@pytest.mark.asyncio
+async def test_unreachable_replica_falls_back_to_primary(session_factory, replica_monitor):
+    replica_monitor.lag_query = text('SELECT missing_column')
+    replica_monitor.checked_at = float('-inf')
+    assert await replica_monitor.check() is None
+    assert not replica_monitor.available
+
+    async with session_factory() as session:
+        assert await UserRepository(session).get_user_by_username('primary') is not None
@@ -0,0 +1,162 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+from passlib.hash import bcrypt
+from sqlalchemy import select
+
+from src.auth.models import User
+from src.config import settings
+from src.config.security import (
+    HashingPool,
+    LatencySampler,
+    PasswordHasher,
+    calibrate_bcrypt_rounds,
+    hash_duration,
+    hash_rejected,
+    hashing_pool,
+    password_context_config,
+    pwd_context,
+    verify_latency,
+)
+from tests.test_jwt import create_valid_token
+from tests.test_user import create_valid_user
+
+
+@pytest.fixture
+def configure_hashing():
+    """Перенастраивает общий контекст хеширования и восстанавливает его после теста"""
+    original = pwd_context.to_dict()
+    yield hashing_pool.configure
+    hashing_pool.configure(original)
+
+
+def _slow_job(delay):
+    time.sleep(delay)
+    return delay
+
+
+@pytest.mark.asyncio
+async def test_password_hasher_roundtrip():
+    password_hash = await PasswordHasher.get_password_hash('password_123')
+    assert await PasswordHasher.verify_password('password_123', password_hash)
+    assert not await PasswordHasher.verify_password('password_', password_hash)
+
+
+@pytest.mark.asyncio
+async def test_hashing_pool_records_metrics():
+    pool = HashingPool('thread', workers=1, max_queue=1)
+    observed = hash_duration.count
+    assert await pool.run(_slow_job, 0.01) == 0.01
+    assert hash_duration.count == observed + 1
+    assert pool.pending == 0
+    pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_hashing_pool_rejects_when_saturated():
+    pool = HashingPool('thread', workers=1, max_queue=1)
+    rejected = hash_rejected.value
+    jobs = [asyncio.create_task(pool.run(_slow_job, 0.2)) for _ in range(2)]
+    await asyncio.sleep(0)
+
+    with pytest.raises(HTTPException) as exc:
+        await pool.run(_slow_job, 0.2)
+    assert exc.value.status_code == 503
+    assert hash_rejected.value == rejected + 1
+
+    await asyncio.gather(*jobs)
+    pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_capped_map_leaves_workers_for_other_jobs():
+    """Пакет с ограничением занимает только свою долю пула, одиночная задача не ждет его и не получает 503"""
+    pool = HashingPool('thread', workers=2, max_queue=0)
+    batch = asyncio.create_task(pool.map(_slow_job, [0.05] * 6, max_workers=1))
+    await asyncio.sleep(0.01)
+    assert pool.pending == 1
+
+    started = time.monotonic()
+    assert await pool.run(_slow_job, 0.01) == 0.01
+    assert time.monotonic() - started < 0.05
+    assert await batch == [0.05] * 6
+    pool.shutdown()
+
+
+def _bcrypt_hash(rounds):
+    return bcrypt.using(rounds=rounds).hash('password_123')
+
+
+def test_calibrate_bcrypt_rounds_bounds():
+    assert calibrate_bcrypt_rounds(0.000001, min_rounds=10) == 10
+    assert calibrate_bcrypt_rounds(3600, min_rounds=10, max_rounds=14) == 14
+
+
+@pytest.mark.asyncio
+async def test_verify_and_update_follows_cost(configure_hashing):
+    configure_hashing(password_context_config(6))
+
+    is_correct, new_hash = await PasswordHasher.verify_and_update('password_123', _bcrypt_hash(4))
+    assert is_correct
+    assert bcrypt.from_string(new_hash).rounds == 6
+
+    # within one round of the target, no rehash
+    assert await PasswordHasher.verify_and_update('password_123', _bcrypt_hash(7)) == (True, None)
+
+    is_correct, new_hash = await PasswordHasher.verify_and_update('password_123', _bcrypt_hash(9))
+    assert bcrypt.from_string(new_hash).rounds == 6
+
+    assert await PasswordHasher.verify_and_update('wrong_password', new_hash) == (False, None)
+
+
+@pytest.mark.asyncio
+async def test_verify_and_update_migrates_to_argon2id(configure_hashing, monkeypatch):
+    monkeypatch.setattr(settings.hashing, 'SCHEME', 'argon2id')
+    monkeypatch.setattr(settings.hashing, 'ARGON2_MEMORY_KIB', 1024)
+    configure_hashing(password_context_config(4))
+
+    is_correct, new_hash = await PasswordHasher.verify_and_update('password_123', _bcrypt_hash(4))
+    assert is_correct
+    assert new_hash.startswith('$argon2id$')
+    assert 'm=1024' in new_hash
+    assert await PasswordHasher.verify_and_update('password_123', new_hash) == (True, None)
+
+
+@pytest.mark.asyncio
+async def test_login_rehashes_password(
+    client, async_db_session, create_valid_user, create_valid_token, configure_hashing
+):
+    configure_hashing(password_context_config(4))
+    await create_valid_user()
+    configure_hashing(password_context_config(6))
+
+    response = await create_valid_token()
+    assert response.status_code == 204
+    password_hash = await async_db_session.scalar(select(User.password).where(User.username == 'user'))
+    assert bcrypt.from_string(password_hash).rounds == 6
+
+
+def test_latency_sampler_keeps_recent_values():
+    sampler = LatencySampler(2)
+    assert sampler.sample() is None
+    for value in (1.0, 2.0, 3.0):
+        sampler.observe(value)
+    assert {sampler.sample() for _ in range(50)} == {2.0, 3.0}
+
+
+@pytest.mark.asyncio
+async def test_unknown_user_looks_like_wrong_password(client, create_valid_user, monkeypatch):
+    await create_valid_user()
+    wrong_password = await client.post('/token/create/', json={'username': 'user', 'password': 'wrong_password'})
+
+    monkeypatch.setattr(verify_latency, '_samples', [0.05])
+    verified = hash_duration.count
+    started = time.monotonic()
+    unknown_user = await client.post('/token/create/', json={'username': 'nobody', 'password': 'wrong_password'})
+
+    assert time.monotonic() - started >= 0.05
+    assert hash_duration.count == verified
+    assert unknown_user.status_code == wrong_password.status_code == 401
+    assert unknown_user.json() == wrong_password.json()
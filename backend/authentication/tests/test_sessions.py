@@ -0,0 +1,97 @@
+import pytest
+
+from src.config.security import JwtToken
+from tests.test_jwt import create_valid_token
+from tests.test_user import create_valid_user
+
+
+async def login(client, create_valid_token):
+    client.cookies.clear()
+    response = await create_valid_token()
+    return response.cookies.get('access'), response.cookies.get('refresh')
+
+
+async def refresh(client, refresh_token):
+    client.cookies.clear()
+    client.cookies['refresh'] = refresh_token
+    return await client.post('/token/refresh/')
+
+
+def use(client, access_token):
+    client.cookies.clear()
+    client.cookies['access'] = access_token
+
+
+@pytest.mark.asyncio
+async def test_list_and_revoke_sessions(client, create_valid_user, create_valid_token):
+    await create_valid_user()
+    first_access, first_refresh = await login(client, create_valid_token)
+    second_access, second_refresh = await login(client, create_valid_token)
+
+    use(client, second_access)
+    sessions = (await client.get('/users/me/sessions/')).json()
+    first_family = JwtToken.decode_token(first_refresh, JwtToken.TokenType.REFRESH)['fam']
+    assert {session['id'] for session in sessions} == {
+        first_family,
+        JwtToken.decode_token(second_refresh, JwtToken.TokenType.REFRESH)['fam'],
+    }
+    assert all(session['expires_at'] > session['created_at'] for session in sessions)
+
+    assert (await client.delete(f'/users/me/sessions/{first_family}/')).status_code == 204
+    assert (await client.delete(f'/users/me/sessions/{first_family}/')).status_code == 404
+    assert len((await client.get('/users/me/sessions/')).json()) == 1
+    assert (await refresh(client, first_refresh)).status_code == 401
+    use(client, first_access)
+    assert (await client.get('/users/me/')).status_code == 401
+
+    use(client, second_access)
+    assert (await client.delete('/users/me/sessions/')).status_code == 204
+    assert (await client.get('/users/me/')).status_code == 401
+    assert (await refresh(client, second_refresh)).status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_session_index_follows_rotation(client, create_valid_user, create_valid_token):
+    await create_valid_user()
+    _, refresh_token = await login(client, create_valid_token)
+    response = await refresh(client, refresh_token)
+
+    use(client, response.cookies.get('access'))
+    sessions = (await client.get('/users/me/sessions/')).json()
+    assert [session['id'] for session in sessions] == [
+        JwtToken.decode_token(refresh_token, JwtToken.TokenType.REFRESH)['fam']
+    ]
+
+    # the access token issued by the rotation is the one revoked with the family
+    assert (await client.delete('/users/me/sessions/')).status_code == 204
+    assert (await client.get('/users/me/')).status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_password_change_revokes_sessions(client, create_valid_user, create_valid_token):
+    user = await create_valid_user()
+    access_token, refresh_token = await login(client, create_valid_token)
+
+    response = await client.patch(f'/users/{user["id"]}/', json={'email': 'user@mail.com'})
+    assert response.status_code == 200
+    use(client, access_token)
+    assert (await client.get('/users/me/')).status_code == 200
+
+    response = await client.patch(
+        f'/users/{user["id"]}/', json={'password': 'password_456', 'password_retry': 'password_456'}
+    )
+    assert response.status_code == 200
+    use(client, access_token)
+    assert (await client.get('/users/me/')).status_code == 401
+    assert (await refresh(client, refresh_token)).status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_deactivate_revokes_sessions(client, create_valid_user, create_valid_token):
+    user = await create_valid_user()
+    access_token, refresh_token = await login(client, create_valid_token)
+
+    assert (await client.delete(f'/users/{user["id"]}/')).status_code == 200
+    use(client, access_token)
+    assert (await client.get('/users/me/')).status_code == 401
+    assert (await refresh(client, refresh_token)).status_code == 401
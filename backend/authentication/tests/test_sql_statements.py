@@ -0,0 +1,68 @@
+import pytest
+
+from tests.test_jwt import create_valid_token
+from tests.test_user import create_valid_user
+
+
+@pytest.mark.asyncio
+async def test_create_user_statements(client, sql_statements):
+    response = await client.post(
+        '/users/', json={'username': 'user', 'password': 'password_123', 'password_retry': 'password_123'}
+    )
+    assert response.status_code == 201
+    assert response.json()['id']
+    # INSERT ... RETURNING fills the response, no SELECT after the write
+    assert len(sql_statements) == 1
+    assert sql_statements[0].startswith('INSERT INTO users')
+
+
+@pytest.mark.asyncio
+async def test_update_user_statements(client, create_valid_user, sql_statements):
+    user = await create_valid_user()
+    sql_statements.clear()
+
+    response = await client.patch(f'/users/{user["id"]}/', json={'email': 'user@mail.com'})
+    assert response.status_code == 200
+    assert response.json()['email'] == 'user@mail.com'
+    assert len(sql_statements) == 1
+    assert sql_statements[0].startswith('UPDATE users')
+
+
+@pytest.mark.asyncio
+async def test_update_missing_user_statements(client, sql_statements):
+    response = await client.patch('/users/999/', json={'email': 'user@mail.com'})
+    assert response.status_code == 404
+    assert len(sql_statements) == 1
+
+
+@pytest.mark.asyncio
+async def test_get_user_statements(client, create_valid_user, sql_statements):
+    user = await create_valid_user()
+    sql_statements.clear()
+
+    response = await client.get(f'/users/{user["id"]}/')
+    assert response.status_code == 200
+    assert len(sql_statements) == 1
+
+    # served from the user cache
+    response = await client.get(f'/users/{user["id"]}/')
+    assert response.status_code == 200
+    assert len(sql_statements) == 1
+
+
+@pytest.mark.asyncio
+async def test_token_statements(client, create_valid_user, create_valid_token, sql_statements):
+    await create_valid_user()
+    sql_statements.clear()
+
+    response = await create_valid_token()
+    assert response.status_code == 204
+    # user with groups: SELECT users + selectinload of groups
+    assert len(sql_statements) == 2
+
+    client.cookies['access'] = response.cookies.get('access')
+    client.cookies['refresh'] = response.cookies.get('refresh')
+    sql_statements.clear()
+    response = await client.post('/token/delete/')
+    assert response.is_success
+    assert sql_statements == []
@@ -0,0 +1,59 @@
+import pytest
+
+from src.auth.throttle import login_throttle
+from src.config import settings
+from src.config.security import hash_duration
+from tests.test_jwt import create_valid_token
+from tests.test_user import create_valid_user
+
+
+async def login(client, username='user', password='wrong_password'):
+    return await client.post('/token/create/', json={'username': username, 'password': password})
+
+
+@pytest.mark.asyncio
+async def test_user_lockout_skips_password_check(client, create_valid_user):
+    await create_valid_user()
+    for _ in range(settings.throttle.USER_MAX_ATTEMPTS):
+        assert (await login(client)).status_code == 401
+
+    verified = hash_duration.count
+    response = await login(client, password='password_123')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) == settings.throttle.LOCKOUT_BASE_SEC
+    assert hash_duration.count == verified
+
+
+@pytest.mark.asyncio
+async def test_successful_login_clears_user_window(client, create_valid_user, create_valid_token):
+    await create_valid_user()
+    for _ in range(settings.throttle.USER_MAX_ATTEMPTS - 1):
+        assert (await login(client)).status_code == 401
+    assert (await create_valid_token()).status_code == 204
+
+    for _ in range(settings.throttle.USER_MAX_ATTEMPTS):
+        assert (await login(client)).status_code == 401
+    assert (await login(client)).status_code == 429
+
+
+@pytest.mark.asyncio
+async def test_ip_limit_spans_usernames(client, monkeypatch):
+    monkeypatch.setattr(login_throttle, 'ip_limit', 3)
+    for i in range(3):
+        assert (await login(client, username=f'unknown_{i}')).status_code == 401
+
+    response = await login(client, username='unknown_3')
+    assert response.status_code == 429
+
+
+@pytest.mark.asyncio
+async def test_lockout_grows_with_strikes(client, async_redis, monkeypatch):
+    monkeypatch.setattr(login_throttle, 'user_limit', 1)
+    assert (await login(client)).status_code == 401
+    assert (await login(client)).status_code == 429
+
+    # lockout expired, the window is still full
+    await async_redis.delete('throttle:user:user:lock')
+    response = await login(client)
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) == 2 * settings.throttle.LOCKOUT_BASE_SEC
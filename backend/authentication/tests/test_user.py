@@ -1,9 +1,17 @@
+import json
 import re
 
 import pytest
 import pytest_asyncio
 from unittest.mock import ANY
 
+from sqlalchemy import insert
+
+from src.auth.dependencies import get_admin_user
+from src.auth.models import Group, Role, UserGroup
+from src.main import app
+from src.middleware import AuthUser
+
 
 @pytest_asyncio.fixture
 async def create_valid_user(client):
@@ -22,6 +30,12 @@ async def create_valid_user(client):
     return _create_user
 
 
+@pytest.fixture
+def as_admin(client):
+    """Запросы клиента проходят проверку администратора"""
+    app.dependency_overrides[get_admin_user] = lambda: AuthUser(id=0, role=Role.ADMIN, groups=())
+
+
 ###############################################################
 
 
@@ -142,4 +156,117 @@ async def test_deactivate_user(client, create_valid_user, user_id, is_valid):
         assert response.status_code == 200
         assert response.text == 'true'
     else:
-        assert response.status_code == 404
\ No newline at end of file
+        assert response.status_code == 404
+
+@pytest.mark.asyncio
+async def test_get_self_user(client, create_valid_user):
+    response = await client.get('/users/me/')
+    assert response.status_code == 401
+
+    await create_valid_user()
+    response = await client.post('/token/create/', json={'username': 'user', 'password': 'password_123'})
+    client.cookies['access'] = response.cookies.get('access')
+    client.cookies['refresh'] = response.cookies.get('refresh')
+
+    response = await client.get('/users/me/')
+    assert response.status_code == 200
+    assert response.json() == {'username': 'user', 'email': None, 'role': 'User', 'groups': []}
+
+    await client.post('/token/delete/')
+    response = await client.get('/users/me/')
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_get_users_batch(client, create_valid_user):
+    first = await create_valid_user('user_one')
+    second = await create_valid_user('user_two')
+
+    response = await client.post('/users/batch/', json={'ids': [second['id'], 2398, first['id'], second['id']]})
+    assert response.status_code == 200
+    data = response.json()
+    assert [user['id'] for user in data['users']] == [second['id'], first['id']]
+    assert data['users'][0] == {'id': second['id'], 'username': 'user_two', 'email': None, 'groups': []}
+    assert data['missing'] == [2398]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('ids', [[], list(range(1, 102))], ids=['empty', 'too_many'])
+async def test_get_users_batch_limits(client, ids):
+    response = await client.post('/users/batch/', json={'ids': ids})
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_list_users_keyset_pagination(client, as_admin, create_valid_user):
+    created = [await create_valid_user(f'user_{i}') for i in range(5)]
+
+    ids, cursor = [], None
+    while True:
+        params = {'limit': 2} if cursor is None else {'limit': 2, 'after': cursor}
+        response = await client.get('/users/', params=params)
+        assert response.status_code == 200
+        page = response.json()
+        ids += [user['id'] for user in page['items']]
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    assert ids == [user['id'] for user in created]
+
+
+@pytest.mark.asyncio
+async def test_list_users_filters(client, as_admin, create_valid_user):
+    active = await create_valid_user('user_active')
+    inactive = await create_valid_user('user_inactive')
+    await client.delete(f'/users/{inactive["id"]}/')
+
+    response = await client.get('/users/', params={'is_active': True})
+    assert [user['id'] for user in response.json()['items']] == [active['id']]
+
+    response = await client.get('/users/', params={'role': 'Admin'})
+    assert response.json() == {'items': [], 'next_cursor': None}
+
+    response = await client.get('/users/', params={'group': 'staff'})
+    assert response.json()['items'] == []
+
+
+@pytest.mark.asyncio
+async def test_list_users_filters_by_group(client, as_admin, create_valid_user, async_db_session):
+    staff = await create_valid_user('user_staff')
+    await create_valid_user('user_other')
+    group = Group(name='staff')
+    async_db_session.add(group)
+    await async_db_session.flush()
+    await async_db_session.execute(insert(UserGroup).values(user=staff['id'], group=group.id))
+
+    response = await client.get('/users/', params={'group': 'staff'})
+    assert [user['id'] for user in response.json()['items']] == [staff['id']]
+
+    response = await client.get('/users/', params={'group': 'staff', 'format': 'ndjson'})
+    assert [json.loads(line)['id'] for line in response.text.splitlines()] == [staff['id']]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('params', [{}, {'format': 'ndjson'}])
+async def test_list_users_requires_admin(client, create_valid_user, params):
+    response = await client.get('/users/', params=params)
+    assert response.status_code == 401
+
+    await create_valid_user()
+    response = await client.post('/token/create/', json={'username': 'user', 'password': 'password_123'})
+    client.cookies['access'] = response.cookies.get('access')
+    response = await client.get('/users/', params=params)
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_export_users_ndjson(client, as_admin, create_valid_user):
+    created = [await create_valid_user(f'user_{i}') for i in range(3)]
+
+    response = await client.get('/users/', params={'format': 'ndjson', 'after': created[0]['id']})
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row['id'] for row in rows] == [user['id'] for user in created[1:]]
+    assert rows[0] == {'id': created[1]['id'], 'username': 'user_1', 'email': None, 'role': 'User', 'is_active': True}